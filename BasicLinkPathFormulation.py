@@ -5,7 +5,7 @@
 from networkx.readwrite import json_graph
 from pulp import LpProblem, LpMinimize, LpVariable, LpStatus, lpSum
 import Utilities.jsonconverter as jc
-from Utilities.utilities import link_in_path
+from Utilities.utilities import path_link_incidence
 import json
 
 
@@ -46,13 +46,13 @@ if __name__ == '__main__':
             tmp_list.append((len(paths[d][p]) - 1)*demand_paths[d, p])
     prob += lpSum(tmp_list)
     # Now lets include the link capacity constraints
-    # we have one to add for each lin
-    for link in link_list:
+    # we have one to add for each link, with the paths using the link taken from
+    # the path-link incidence matrix
+    incidence, path_keys = path_link_incidence(link_list, paths, demand_list)
+    for i, link in enumerate(link_list):
         tmp_list = []
-        for d in demand_list:
-            for p in range(len(paths[d])):
-                if link_in_path(link, paths[d][p]):
-                    tmp_list.append(demand_paths[d, p])
+        for j in incidence.indices[incidence.indptr[i]:incidence.indptr[i + 1]]:
+            tmp_list.append(demand_paths[path_keys[j]])
         link_name = "L{}_{}".format(link[0], link[1])
         prob += lpSum(tmp_list)<= g[link[0]][link[1]]['capacity'], "LinkCap|" + link_name
 
@@ -15,7 +15,7 @@ import random
 start_time = time.time()
 
 
-def basic_capacitated_node_link(g, demands):
+def basic_capacitated_node_link(g, demands, presolve=False):
     """ Creates a basic capacitated network design problem in node-link formulation
 
         Parameters
@@ -24,11 +24,23 @@ def basic_capacitated_node_link(g, demands):
             a directed network graph g,
         d : dictionary
             a dictionary of demands indexed by node pairs
+        presolve : boolean
+            (optional) leave out the variables and rows that can't carry flow, e.g.,
+            those of zero demands, see :func:`Utilities.sparse_lp.presolve_node_link_lp`.
+            The link flow dictionary then has 0.0 instead of a variable for them.
         Returns
         -------
         pulp.LpProblem
             a PuLP problem instance suitable for solving or writing.
     """
+    if presolve:
+        from Utilities.sparse_lp import presolve_node_link_lp
+        prob, kept_flows = presolve_node_link_lp(g, demands).to_pulp()
+        link_flows = {}
+        for link in sorted(g.edges()):
+            for demand in sorted(demands.keys()):
+                link_flows[(link, demand)] = kept_flows.get((link, demand), 0.0)
+        return prob, link_flows
     # Set up Node Link Formulation Linear Program
     # First some nice lists to help us stay organized
     demand_list = sorted(demands.keys())
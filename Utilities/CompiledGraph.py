@@ -0,0 +1,206 @@
+""" An integer indexed, compressed sparse row (CSR) representation of a NetworkX graph.
+    Path algorithms that run many searches over the same network can compile the graph
+    once and then work with plain arrays instead of nested dictionary lookups.
+"""
+from array import array
+from math import sqrt
+
+
+class CompiledGraph(object):
+    """ A read-only CSR snapshot of a NetworkX Graph or DiGraph.
+
+        Nodes are numbered in the order returned by `g.nodes()` and edges in the order
+        returned by `g.edges()`. Each undirected edge yields two arcs (one per direction)
+        that share a single edge id, so masking an edge id blocks both directions just
+        like removing the edge from a networkx Graph would.
+
+        Parameters
+        ----------
+        g : networkx.Graph
+            a networkx graph or directed graph
+        wt : string
+            the link attribute to be used as the arc length, or None for unit lengths,
+            i.e., hop counts.
+        cap : string
+            (optional) the link attribute holding the link capacity.
+        reverse : boolean
+            if *True* the arcs of a directed graph are reversed, which is handy for
+            computing distances *to* a node.
+
+        If every node has `x` and `y` coordinate attributes they are kept in `xy` for
+        goal directed searches, see :meth:`heuristic_scale`.
+    """
+    def __init__(self, g, wt="weight", cap=None, reverse=False):
+        self.wt = wt
+        self.cap = cap
+        self.directed = g.is_directed()
+        self.nodes = list(g.nodes())  # node id -> node label
+        self.index = {}  # node label -> node id
+        for i, node in enumerate(self.nodes):
+            self.index[node] = i
+        self.xy = []  # node id -> (x, y), None if some node lacks coordinates
+        for node, data in g.nodes(data=True):
+            if "x" not in data or "y" not in data:
+                self.xy = None
+                break
+            self.xy.append((data["x"], data["y"]))
+        self._scale = False  # heuristic_scale() not computed yet
+        self.edges = []  # edge id -> (nodeA, nodeZ) as given by g.edges()
+        self.edge_weights = array('d')
+        self.edge_caps = array('d')
+        adj = [[] for _ in self.nodes]
+        for e in g.edges():
+            eid = len(self.edges)
+            attrs = g[e[0]][e[1]]
+            w = attrs[wt] if wt is not None else 1.0
+            self.edges.append(e)
+            self.edge_weights.append(w)
+            if cap is not None:
+                self.edge_caps.append(attrs[cap])
+            u = self.index[e[0]]
+            v = self.index[e[1]]
+            if not self.directed:
+                adj[u].append((v, w, eid))
+                adj[v].append((u, w, eid))
+            elif reverse:
+                adj[v].append((u, w, eid))
+            else:
+                adj[u].append((v, w, eid))
+        # Flatten the adjacency lists into the CSR arrays
+        self.indptr = array('l', [0])
+        self.indices = array('l')
+        self.weights = array('d')
+        self.arc_edge = array('l')
+        for arcs in adj:
+            for v, w, eid in arcs:
+                self.indices.append(v)
+                self.weights.append(w)
+                self.arc_edge.append(eid)
+            self.indptr.append(len(self.indices))
+
+    def reversed(self):
+        """ Returns a compiled graph with all arcs reversed, sharing node and edge ids
+            with this one. For undirected graphs this is the graph itself.
+        """
+        if not self.directed:
+            return self
+        rg = CompiledGraph.__new__(CompiledGraph)
+        rg.__dict__.update(self.__dict__)
+        radj = [[] for _ in self.nodes]
+        for u in range(len(self.nodes)):
+            for a in range(self.indptr[u], self.indptr[u + 1]):
+                radj[self.indices[a]].append((u, self.weights[a], self.arc_edge[a]))
+        rg.indptr = array('l', [0])
+        rg.indices = array('l')
+        rg.weights = array('d')
+        rg.arc_edge = array('l')
+        for arcs in radj:
+            for v, w, eid in arcs:
+                rg.indices.append(v)
+                rg.weights.append(w)
+                rg.arc_edge.append(eid)
+            rg.indptr.append(len(rg.indices))
+        return rg
+
+    def reweighted(self, edge_weights):
+        """ Returns a compiled graph with the same nodes, edges and arcs but new link
+            weights, e.g., dual adjusted weights for pricing in column generation.
+
+            Parameters
+            ----------
+            edge_weights : sequence
+                the new weight of each edge, indexed by edge id.
+        """
+        wg = CompiledGraph.__new__(CompiledGraph)
+        wg.__dict__.update(self.__dict__)
+        wg.edge_weights = array('d', edge_weights)
+        wg.weights = array('d', [wg.edge_weights[eid] for eid in self.arc_edge])
+        wg._scale = False
+        return wg
+
+    def heuristic_scale(self):
+        """ Checks whether the straight line distance between node coordinates gives an
+            admissible (and consistent) estimate of the remaining path length. Returns the
+            largest factor `c` such that every link weight is at least `c` times the
+            distance between its end nodes, or None if there are no coordinates, a link
+            weight is negative or no such positive factor exists. For weights set by
+            :func:`Utilities.utilities.wt_by_distance` the factor is (about) one.
+        """
+        if self._scale is not False:
+            return self._scale
+        scale = None
+        if self.xy is not None:
+            scale = float("inf")
+            for eid, e in enumerate(self.edges):
+                w = self.edge_weights[eid]
+                dist = self.distance(self.index[e[0]], self.index[e[1]])
+                if w < 0:
+                    scale = None
+                    break
+                if dist > 0:
+                    scale = min(scale, w / dist)
+            if scale is not None and (scale <= 0 or scale == float("inf")):
+                scale = None
+            if scale is not None:
+                scale *= 1.0 - 1e-9  # Guard against rounding in the weights
+        self._scale = scale
+        return scale
+
+    def distance(self, u, v):
+        """ Returns the straight line distance between node ids `u` and `v`. """
+        xu, yu = self.xy[u]
+        xv, yv = self.xy[v]
+        return sqrt((xu - xv)**2 + (yu - yv)**2)
+
+    def num_nodes(self):
+        """ Returns the number of nodes in the compiled graph. """
+        return len(self.nodes)
+
+    def num_edges(self):
+        """ Returns the number of (undirected or directed) edges in the compiled graph. """
+        return len(self.edges)
+
+    def edge_id(self, u, v):
+        """ Returns the id of the edge carrying the arc from node id `u` to node id `v`,
+            or -1 if there is no such arc.
+        """
+        indices = self.indices
+        for a in range(self.indptr[u], self.indptr[u + 1]):
+            if indices[a] == v:
+                return self.arc_edge[a]
+        return -1
+
+    def path_metrics(self, node_list):
+        """ Computes the cost and the capacity of a path given as a node list in one pass.
+            The capacity is None if the graph was compiled without a capacity attribute.
+        """
+        return self.path_metrics_ids(self.node_ids(node_list))
+
+    def path_metrics_ids(self, id_list):
+        """ Computes the cost and the capacity of a path given as a list of node ids. """
+        cost = 0.0
+        p_cap = float("inf")
+        for i in range(len(id_list) - 1):
+            eid = self.edge_id(id_list[i], id_list[i + 1])
+            if eid < 0:
+                raise Exception('Bad Path')
+            cost += self.edge_weights[eid]
+            if self.cap is not None:
+                p_cap = min(p_cap, self.edge_caps[eid])
+        if self.cap is None:
+            p_cap = None
+        return cost, p_cap
+
+    def node_ids(self, node_list):
+        """ Converts a list of node labels into a list of node ids. """
+        index = self.index
+        return [index[n] for n in node_list]
+
+    def node_labels(self, id_list):
+        """ Converts a list of node ids into a list of node labels. """
+        nodes = self.nodes
+        return [nodes[i] for i in id_list]
+
+    def __str__(self):
+        return "CompiledGraph: {} nodes, {} edges, {} arcs".format(len(self.nodes), len(self.edges),
+                                                                  len(self.indices))
@@ -0,0 +1,229 @@
+""" Link and node disjoint paths via the Suurballe/Bhandari method.
+    Working and protection paths are found with one shortest path search per path on
+    a transformed graph, instead of enumerating k-shortest paths and filtering them for
+    disjointness. The paths returned have the smallest total cost of any set of
+    disjoint paths between the two nodes.
+"""
+from Utilities.CompiledGraph import CompiledGraph
+from Utilities.ModifiedDijkstra import ModifiedDijkstra
+from Utilities.YenKShortestPaths import WeightedPath
+
+
+class DisjointPaths(object):
+    """ Computes k link disjoint or node disjoint paths between a pair of nodes.
+
+        The first path is a shortest path, taken from a shortest path tree that is cached
+        per source node. For each further path the links of the paths found so far are
+        replaced by reversed arcs of negative length (Bhandari's transformation) and, for
+        node disjoint paths, the intermediate nodes of those paths are split into an
+        in and an out node. A shortest path on this graph may use reversed arcs; such
+        link pairs cancel out and the remaining links are regrouped into disjoint paths.
+        Like Suurballe's algorithm the searches run on reduced link lengths (shifted by
+        node potentials) so that they are ordinary Dijkstra searches despite the negative
+        arcs. The transformed graph is an overlay on the compiled graph, searched with
+        :meth:`ModifiedDijkstra.overlay_search`, so nothing is copied.
+
+        Parameters
+        ----------
+        graph : networkx.Graph
+            a directed or undirected graph, or a :class:`CompiledGraph` in which case the
+            weight and capacity attributes are the ones it was compiled with.
+        weight : string
+            the string used for the link weight (cost) attribute
+        cap : string
+            the string used for the link capacity attribute
+
+        The graph must not be modified while this object is in use.
+    """
+    def __init__(self, graph, weight="weight", cap="capacity"):
+        if isinstance(graph, CompiledGraph):
+            self.cg = graph
+        else:
+            self.cg = CompiledGraph(graph, weight, cap)
+        self.alg = ModifiedDijkstra(self.cg, self.cg.wt, engine="heap")
+        self.treeCache = {}  # Shortest path trees indexed by source node
+        self.inf = float("inf")
+
+    def getLinkDisjointPaths(self, source, dest, k=2):
+        """ Finds up to `k` link disjoint paths of minimum total cost.
+
+            Parameters
+            ----------
+            source : string
+               The beginning node of the paths.
+            dest : string
+                The termination node of the paths.
+            k : integer
+                (optional) the number of paths, two (working and protection) by default.
+
+            Returns
+            -------
+            paths : list
+                a list of WeightedPath in order of increasing cost. Shorter than `k` if the
+                graph doesn't have `k` disjoint paths, empty if `dest` can't be reached.
+        """
+        return self._disjointPaths(source, dest, k, False)
+
+    def getNodeDisjointPaths(self, source, dest, k=2):
+        """ Finds up to `k` node disjoint paths of minimum total cost. Apart from `source`
+            and `dest` no node is used by more than one path. Same parameters and return
+            value as :meth:`getLinkDisjointPaths`.
+        """
+        return self._disjointPaths(source, dest, k, True)
+
+    def _disjointPaths(self, source, dest, k, node_disjoint):
+        cg = self.cg
+        if k <= 0 or source == dest:
+            return []
+        tree = self.treeCache.get(source)
+        if tree is None:
+            tree = self.alg.shortest_path_tree(source)
+            self.treeCache[source] = tree
+        s = cg.index[source]
+        t = cg.index[dest]
+        first = tree.getPathIds(t)
+        if first is None:
+            return []
+        flow = {}  # Edge id -> (tail, head) node ids of the links used by the paths
+        for i in range(len(first) - 1):
+            flow[cg.edge_id(first[i], first[i + 1])] = (first[i], first[i + 1])
+        pot = list(tree.getDistIds())  # Node potentials, initially the distances from s
+        pot_out = {}  # Potentials of the out nodes of split nodes
+        for count in range(1, k):
+            if not self._augment(s, t, flow, pot, pot_out, node_disjoint):
+                break
+        paths = [WeightedPath.fromIds(ids, None, cg, 0) for ids in _decompose(s, t, flow)]
+        paths.sort()
+        return paths
+
+    def _augment(self, s, t, flow, pot, pot_out, node_disjoint):
+        """ Adds one more path to `flow` by a shortest path search on the transformed graph,
+            updating the node potentials. Returns False if there is no further path.
+        """
+        cg = self.cg
+        n = cg.num_nodes()
+        weights = cg.edge_weights
+        # Split the intermediate nodes of the paths, their out nodes get ids from n on
+        split = []
+        if node_disjoint:
+            split = sorted(set(head for tail, head in flow.values() if head != t))
+        out_id = {}
+        for j, v in enumerate(split):
+            out_id[v] = n + j
+        for v in list(pot_out.keys()):
+            if v not in out_id:
+                pot[v] = pot_out.pop(v)  # A merged node keeps the out node potential
+        ext_pot = pot + [pot_out.get(v, pot[v]) for v in split]
+        # Reversed arcs of negative length for the links of the paths, tagged with the
+        # complement of their edge id, plus the reversed zero length arcs from the out to
+        # the in node of split nodes. The links of a split node leave from its out node.
+        extra = {}
+        moved = {}
+        for e, (u, v) in flow.items():
+            extra.setdefault(v, []).append((out_id.get(u, u), -weights[e], ~e))
+        for v in split:
+            extra.setdefault(out_id[v], []).append((v, 0.0, None))
+            moved[v] = -1
+            moved[out_id[v]] = v
+        dist, pred = self.alg.overlay_search(s, t, ext_pot, extra, moved, set(flow.keys()))
+        if dist[t] == self.inf:
+            return False
+        # Cancel or add the links of the new path
+        v = t
+        while v != s:
+            u, tag = pred[v]
+            if tag is not None and tag >= 0:
+                flow[tag] = (u if u < n else split[u - n], v)
+            elif tag is not None:
+                del flow[~tag]
+            v = u
+        # Keep the reduced link lengths non-negative for the next search
+        bound = dist[t]
+        for x in range(len(ext_pot)):
+            ext_pot[x] += min(dist[x], bound)
+        pot[:] = ext_pot[0:n]
+        pot_out.clear()
+        for j, v in enumerate(split):
+            pot_out[v] = ext_pot[n + j]
+        return True
+
+
+def _decompose(s, t, flow):
+    """ Splits the links in `flow`, each used once, into paths from node id `s` to node id
+        `t` given as lists of node ids. Cycles left over by the link cancellations are
+        dropped.
+    """
+    out = {}
+    for e, (u, v) in sorted(flow.items()):
+        out.setdefault(u, []).append(v)
+    paths = []
+    while out.get(s):
+        ids = [s]
+        position = {s: 0}
+        u = s
+        while u != t:
+            v = out[u].pop(0)
+            if v in position:
+                # Remove the cycle back to v
+                for x in ids[position[v] + 1:]:
+                    del position[x]
+                del ids[position[v] + 1:]
+            else:
+                position[v] = len(ids)
+                ids.append(v)
+            u = v
+        paths.append(ids)
+    return paths
+
+
+def gen_disjoint_paths(g, demands, k=2, node_disjoint=False, wt="weight", cap="capacity"):
+    """ Generates disjoint demand path candidates, e.g., a working and a protection path
+        per demand pair. Drop-in replacement for :func:`Utilities.utilities.gen_cand_paths`.
+
+        Parameters
+        ----------
+        g : networkx.Graph
+            Graph representing the network.
+        demands : dictionary
+            A dictionary indexed by node pairs representing demands.
+        k : integer
+            (optional) the number of disjoint paths per demand pair, two by default.
+        node_disjoint : boolean
+            (optional) make the paths node disjoint rather than only link disjoint.
+        wt : string
+            (optional) the link weight attribute.
+        cap : string
+            (optional) the link capacity attribute.
+
+        Returns
+        -------
+        paths : dictionary
+            A dictionary indexed by demand (node) pairs, whose value is a list of paths with
+            each path represented by a node list. Demand pairs without k disjoint paths get
+            as many as there are.
+    """
+    alg = DisjointPaths(g, wt, cap)
+    paths = {}
+    for d in demands.keys():
+        if node_disjoint:
+            d_paths = alg.getNodeDisjointPaths(d[0], d[1], k)
+        else:
+            d_paths = alg.getLinkDisjointPaths(d[0], d[1], k)
+        paths[d] = [p.nodeList for p in d_paths]
+    return paths
+
+
+if __name__ == "__main__":
+    import json
+    from networkx.readwrite import json_graph
+
+    g = json_graph.node_link_graph(json.load(open("linkPathEx1.json")))
+    nodes = list(g.nodes())
+    alg = DisjointPaths(g)
+    source, dest = nodes[0], nodes[-1]
+    print("Link disjoint paths from {} to {}:".format(source, dest))
+    for p in alg.getLinkDisjointPaths(source, dest):
+        print(p)
+    print("Node disjoint paths from {} to {}:".format(source, dest))
+    for p in alg.getNodeDisjointPaths(source, dest):
+        print(p)
@@ -1,6 +1,11 @@
 # Copyright 2014 Dr. Greg M. Bernstein
 """ A slightly generalized version of the Dijkstra algorithm.
 """
+from heapq import heappush, heappop
+from math import sqrt
+from Utilities.CompiledGraph import CompiledGraph
+
+
 class ModifiedDijkstra(object):
     """ The Modified Dijkstra algorithm from "Survivable Networks" by Ramesh Bhandari.
         This algorithm works with graphs that can have directed or undirected links.
@@ -10,18 +15,61 @@ class ModifiedDijkstra(object):
         Works with graphs, *g*, in NetworkX format. Specifically Graph and
         DiGraph classes.
 
+        Several engines are available. The original "scan" engine selects the next node
+        with a linear scan of the open set and reads link weights from the networkx
+        graph, i.e., O(V^2) per query. The "heap" engine compiles the graph once into
+        integer indexed CSR arrays (see :class:`CompiledGraph`) and runs a binary heap
+        label-correcting search. Like the scan engine a node whose label improves is
+        re-opened, so the negative arc lengths of the disjoint path computations are
+        handled the same way.
+
+        For point-to-point queries there are two more compiled engines. The "astar"
+        engine is goal directed, using the straight line distance between the `x` and
+        `y` node coordinates as an estimate of the remaining length. The "bidirectional"
+        engine grows searches from both ends until they meet. Each one checks that it is
+        valid for the graph, i.e., coordinates consistent with the link weights for A*
+        and no negative weights for bidirectional search, and otherwise falls back to
+        the "heap" engine. Shortest path trees always use the "heap" engine.
+
         Parameters
         ----------
         g : networkx.Graph
-            a networkx graph or directed graph
+            a networkx graph or directed graph. With the compiled engines an already
+            compiled :class:`CompiledGraph` can be given instead.
         wt : string
             sets the link attribute to be used in computing the path length.
+        engine : string
+            (optional) one of "scan" (default), "heap", "astar" or "bidirectional".
     """
-    def __init__(self, g, wt="weight"):
+    def __init__(self, g, wt="weight", engine="scan"):
+        if engine not in ("scan", "heap", "astar", "bidirectional"):
+            raise ValueError("Unknown engine {}".format(engine))
         self.dist = {} # A map from nodes to their labels (float)
         self.predecessor = {} # A map from a node to a node
         self.g = g;
         self.wt = wt;
+        self.explored = 0 # Nodes taken from the heap(s) by the last compiled search
+        if engine != "scan":
+            if isinstance(g, CompiledGraph):
+                self.cg = g
+            else:
+                self.cg = CompiledGraph(g, wt)
+            self.inf = float("inf")
+            self.scale = None
+            self.rcg = None
+            if engine == "astar":
+                self.scale = self.cg.heuristic_scale()
+                if self.scale is None:
+                    engine = "heap"
+            elif engine == "bidirectional":
+                if min(self.cg.edge_weights or [0.0]) < 0:
+                    engine = "heap"
+                else:
+                    self.rcg = self.cg.reversed()
+            self.engine = engine
+            return
+        self.engine = engine
+        self.cg = None
         edges = g.edges()
         # Set the value for infinite distance in the graph
         self.inf = 0.0;
@@ -30,7 +78,7 @@ class ModifiedDijkstra(object):
         self.inf += 1.0;
     
     
-    def getPath(self, source, dest, as_nodes=False):
+    def getPath(self, source, dest, as_nodes=False, blocked_nodes=None, blocked_edges=None):
         """
         Computes the shortest path in the graph between the given `source` and `dest`
 
@@ -40,6 +88,9 @@ class ModifiedDijkstra(object):
             The source and destination node identifiers (typically strings)
         as_nodes : boolean
             sets the return content of the path
+        blocked_nodes, blocked_edges : set
+            (optional, compiled engines only) node ids and edge ids of the compiled graph that
+            the search must skip, as if they had been removed from the graph.
 
         Returns
         -------
@@ -47,6 +98,10 @@ class ModifiedDijkstra(object):
             the path as a list of links (default) or as a list of
             nodes by setting the `as_nodes` keyword argument to *True*.
         """
+        if self.engine != "scan":
+            return self._getPathHeap(source, dest, as_nodes, blocked_nodes, blocked_edges)
+        if blocked_nodes or blocked_edges:
+            raise ValueError("Blocked nodes and edges require a compiled engine")
         self.dist = {} # A map from nodes to their labels (float)
         self.predecessor = {} # A map from a node to a node
 
@@ -121,3 +176,372 @@ class ModifiedDijkstra(object):
                 minVal = self.dist[vertex]
                 minNode = vertex
         return minNode
+
+    def shortest_path_tree(self, source):
+        """
+        Computes the shortest paths from `source` to every reachable node in one search.
+        Always uses the heap engine, compiling the graph on first use if necessary.
+
+        Parameters
+        ----------
+        source : string
+            The source node identifier
+
+        Returns
+        -------
+        tree : ShortestPathTree
+            a reusable distance/predecessor structure that hands out the path to any
+            destination without further searching.
+        """
+        if self.cg is None:
+            self.cg = CompiledGraph(self.g, self.wt)
+            self.inf = float("inf")
+        s = self.cg.index[source]
+        dist, pred = self._heapSearch(s, -1)
+        return ShortestPathTree(self.cg, s, dist, pred)
+
+    def getPathIds(self, s, t, blocked_nodes=None, blocked_edges=None, limit=None, to_dist=None):
+        """
+        Compiled engine version of getPath working purely with node ids of the compiled
+        graph. Returns the path from node id `s` to node id `t` as a list of node ids, or
+        None if there is no path. Doesn't fill in the `dist` and `predecessor` maps.
+
+        With a cost `limit` only paths of length at most `limit` are searched for: a node
+        is not labelled once its label plus a lower bound on its remaining distance to
+        `t`, taken from the list `to_dist` indexed by node id (zero if not given),
+        exceeds the limit. Returns None if there is no such path.
+        """
+        dist, pred = self._pointSearch(s, t, blocked_nodes, blocked_edges, limit, to_dist)
+        return _traceIds(s, t, pred)
+
+    def overlay_search(self, s, t, pot, extra=None, moved=None, blocked_edges=None):
+        """
+        Heap engine search from node id `s` to node id `t` on an overlay of the compiled
+        graph, such as the transformed graphs of the disjoint path computations (see
+        :class:`Utilities.DisjointPaths.DisjointPaths`). The compiled graph isn't copied:
+
+        * `pot` lists node potentials, which reduce the length w of an arc (u, v) to
+          w + pot[u] - pot[v]. It can be longer than the number of nodes, the ids from
+          cg.num_nodes() on being extra nodes. Nodes with infinite potential are skipped.
+        * `extra` maps a node id to a list of (head node id, length, tag) of additional
+          arcs leaving it.
+        * `moved` maps a node id to the node id of the compiled graph whose links leave
+          from it instead, or -1 for none. By default a node has its own links and extra
+          nodes have none.
+        * links in `blocked_edges` (edge ids) are skipped.
+
+        Returns
+        -------
+        dist : list
+            the reduced distance labels indexed by node id.
+        pred : dictionary
+            map from node id to (predecessor node id, tag) for every labelled node other
+            than `s`, where the tag of a link of the compiled graph is its edge id.
+        """
+        return self._heapSearch(s, t, None, blocked_edges,
+                                overlay=(pot, extra or {}, moved or {}))
+
+    def _getPathHeap(self, source, dest, as_nodes, blocked_nodes=None, blocked_edges=None):
+        """
+        The compiled engine version of getPath. Works on the compiled graph and only
+        fills in the `dist` and `predecessor` maps for the nodes it labelled.
+        """
+        cg = self.cg
+        s = cg.index[source]
+        t = cg.index[dest]
+        dist, pred = self._pointSearch(s, t, blocked_nodes, blocked_edges)
+        self.dist = {}
+        self.predecessor = {}
+        for v in pred:
+            self.dist[cg.nodes[v]] = dist[v]
+            self.predecessor[cg.nodes[v]] = cg.nodes[pred[v]]
+        self.dist[source] = 0.0
+        return _tracePath(cg, s, t, pred, as_nodes)
+
+    def _pointSearch(self, s, t, blocked_nodes, blocked_edges, limit=None, to_dist=None):
+        """
+        Runs the point-to-point search of the selected compiled engine.
+        """
+        if limit is not None and to_dist is None:
+            to_dist = [0.0] * len(self.cg.nodes)
+        if self.engine == "astar":
+            return self._astarSearch(s, t, blocked_nodes, blocked_edges, limit, to_dist)
+        if self.engine == "bidirectional":
+            return self._bidirectionalSearch(s, t, blocked_nodes, blocked_edges, limit, to_dist)
+        return self._heapSearch(s, t, blocked_nodes, blocked_edges, limit, to_dist)
+
+    def _heapSearch(self, s, t, blocked_nodes=None, blocked_edges=None, limit=None, to_dist=None,
+                    overlay=None):
+        """
+        Binary heap label-correcting search from node id `s` on the compiled graph.
+        Stops once node id `t` is taken from the heap (use t = -1 to label the whole graph).
+        Arcs into `blocked_nodes` or belonging to `blocked_edges` are skipped, as are
+        labels that can't lead to a path within `limit` (see getPathIds). Returns
+        the distance labels as a list indexed by node id and a dictionary from node id
+        to predecessor node id for every labelled node other than `s`.
+        With an `overlay` (pot, extra, moved) the search runs on the overlay graph
+        described in overlay_search and returns what it does.
+        """
+        cg = self.cg
+        indptr = cg.indptr
+        indices = cg.indices
+        weights = cg.weights
+        arc_edge = cg.arc_edge
+        masked = bool(blocked_nodes or blocked_edges)
+        if masked:
+            blocked_nodes = blocked_nodes or ()
+            blocked_edges = blocked_edges or ()
+        n = len(cg.nodes)
+        if overlay is not None:
+            pot, extra, moved = overlay
+            n = len(pot)
+        dist = [self.inf] * n
+        pred = {}
+        dist[s] = 0.0
+        heap = [(0.0, s)]
+        explored = 0
+        while heap:
+            d, u = heappop(heap)
+            if d > dist[u]:
+                continue  # Stale heap entry, u was re-labelled since
+            explored += 1
+            if u == t:
+                break
+            if overlay is not None:
+                pu = pot[u]
+                node = moved.get(u, u if u < len(cg.nodes) else -1)
+                arcs = []
+                if node >= 0:
+                    for a in range(indptr[node], indptr[node + 1]):
+                        if not masked or arc_edge[a] not in blocked_edges:
+                            arcs.append((indices[a], weights[a], arc_edge[a]))
+                for v, w, tag in arcs + extra.get(u, []):
+                    if pot[v] == self.inf:
+                        continue
+                    nd = d + w + pu - pot[v]
+                    if nd < dist[v]:
+                        dist[v] = nd
+                        pred[v] = (u, tag)
+                        heappush(heap, (nd, v))
+                continue
+            for a in range(indptr[u], indptr[u + 1]):
+                v = indices[a]
+                if masked and (v in blocked_nodes or arc_edge[a] in blocked_edges):
+                    continue
+                nd = d + weights[a]
+                if nd < dist[v]:
+                    if limit is not None and nd + to_dist[v] > limit:
+                        continue
+                    dist[v] = nd
+                    pred[v] = u
+                    heappush(heap, (nd, v))
+        self.explored = explored
+        return dist, pred
+
+    def _astarSearch(self, s, t, blocked_nodes=None, blocked_edges=None, limit=None, to_dist=None):
+        """
+        A* search from node id `s` to node id `t` on the compiled graph. The heap is
+        ordered by the distance label plus the scaled straight line distance to `t`,
+        which never overestimates the remaining length (see heuristic_scale).
+        Returns the same structures as _heapSearch.
+        """
+        cg = self.cg
+        indptr = cg.indptr
+        indices = cg.indices
+        weights = cg.weights
+        arc_edge = cg.arc_edge
+        scale = self.scale
+        xt, yt = cg.xy[t]
+        xy = cg.xy
+        masked = bool(blocked_nodes or blocked_edges)
+        if masked:
+            blocked_nodes = blocked_nodes or ()
+            blocked_edges = blocked_edges or ()
+        dist = [self.inf] * len(cg.nodes)
+        pred = {}
+        dist[s] = 0.0
+        heap = [(0.0, 0.0, s)]
+        explored = 0
+        while heap:
+            f, d, u = heappop(heap)
+            if d > dist[u]:
+                continue  # Stale heap entry, u was re-labelled since
+            explored += 1
+            if u == t:
+                break
+            for a in range(indptr[u], indptr[u + 1]):
+                v = indices[a]
+                if masked and (v in blocked_nodes or arc_edge[a] in blocked_edges):
+                    continue
+                nd = d + weights[a]
+                if nd < dist[v]:
+                    if limit is not None and nd + to_dist[v] > limit:
+                        continue
+                    dist[v] = nd
+                    pred[v] = u
+                    xv, yv = xy[v]
+                    heappush(heap, (nd + scale * sqrt((xv - xt)**2 + (yv - yt)**2), nd, v))
+        self.explored = explored
+        return dist, pred
+
+    def _bidirectionalSearch(self, s, t, blocked_nodes=None, blocked_edges=None, limit=None,
+                             to_dist=None):
+        """
+        Bidirectional Dijkstra search between node ids `s` and `t` for non-negative
+        link weights. A forward search from `s` and a backward search from `t`, on the
+        reversed arcs, are advanced alternately until the sum of their smallest heap
+        labels reaches the length of the best connection found so far.
+        Returns the same structures as _heapSearch, with the predecessor map patched
+        to follow the best path. With a `limit` the forward labels are pruned using
+        `to_dist` and the backward labels by the limit alone.
+        """
+        if s == t:
+            return self._heapSearch(s, t)
+        inf = self.inf
+        if limit is None:
+            bounds = (None, None)
+        else:
+            bounds = (to_dist, [0.0] * len(to_dist))
+        masked = bool(blocked_nodes or blocked_edges)
+        if masked:
+            blocked_nodes = blocked_nodes or ()
+            blocked_edges = blocked_edges or ()
+        n = len(self.cg.nodes)
+        graphs = (self.cg, self.rcg)
+        dists = ([inf] * n, [inf] * n)
+        preds = ({}, {})  # Forward predecessors and backward successors
+        heaps = ([(0.0, s)], [(0.0, t)])
+        dists[0][s] = 0.0
+        dists[1][t] = 0.0
+        best = inf
+        meet = -1
+        explored = 0
+        while heaps[0] and heaps[1] and heaps[0][0][0] + heaps[1][0][0] < best:
+            side = 0 if heaps[0][0][0] <= heaps[1][0][0] else 1
+            d, u = heappop(heaps[side])
+            dist = dists[side]
+            if d > dist[u]:
+                continue
+            explored += 1
+            other = dists[1 - side]
+            cg = graphs[side]
+            indices = cg.indices
+            weights = cg.weights
+            arc_edge = cg.arc_edge
+            pred = preds[side]
+            bound = bounds[side]
+            for a in range(cg.indptr[u], cg.indptr[u + 1]):
+                v = indices[a]
+                if masked and (v in blocked_nodes or arc_edge[a] in blocked_edges):
+                    continue
+                nd = d + weights[a]
+                if bound is not None and nd + bound[v] > limit:
+                    continue
+                if nd < dist[v]:
+                    dist[v] = nd
+                    pred[v] = u
+                    heappush(heaps[side], (nd, v))
+                if nd + other[v] < best:
+                    best = nd + other[v]
+                    meet = v
+        self.explored = explored
+        pred = preds[0]
+        if meet < 0 or (limit is not None and best > limit):
+            return dists[0], pred
+        # Splice the backward half of the best path onto the forward predecessors
+        succ = preds[1]
+        u = meet
+        while u != t:
+            v = succ[u]
+            pred[v] = u
+            u = v
+        dists[0][t] = best
+        return dists[0], pred
+
+
+class ShortestPathTree(object):
+    """ The result of a single source shortest path search, as returned by
+        :meth:`ModifiedDijkstra.shortest_path_tree`. Useful members: source, dist and
+        predecessor, where `dist` and `predecessor` are maps over the reachable nodes.
+
+        Parameters
+        ----------
+        cg : CompiledGraph
+            the compiled graph that was searched
+        s : integer
+            the node id of the source
+        dist : list
+            distance labels indexed by node id
+        pred : dictionary
+            map from node id to predecessor node id
+    """
+    def __init__(self, cg, s, dist, pred):
+        self.cg = cg
+        self.source = cg.nodes[s]
+        self._s = s
+        self._dist = dist
+        self._pred = pred
+        self.dist = {self.source: 0.0}
+        self.predecessor = {}
+        for v in pred:
+            self.dist[cg.nodes[v]] = dist[v]
+            self.predecessor[cg.nodes[v]] = cg.nodes[pred[v]]
+
+    def getPath(self, dest, as_nodes=False):
+        """
+        Returns the shortest path from the tree source to `dest`, in the same formats
+        as :meth:`ModifiedDijkstra.getPath`, or None if `dest` is not reachable.
+        """
+        return _tracePath(self.cg, self._s, self.cg.index[dest], self._pred, as_nodes)
+
+    def getPathIds(self, t):
+        """
+        Returns the shortest path from the tree source to node id `t` as a list of
+        node ids of the compiled graph, or None if `t` is not reachable.
+        """
+        return _traceIds(self._s, t, self._pred)
+
+    def getDistIds(self):
+        """
+        Returns the distance labels as a list indexed by node id of the compiled graph,
+        infinite for nodes that are not reachable. The list is shared, don't modify it.
+        """
+        return self._dist
+
+    def getPredIds(self):
+        """
+        Returns a dictionary from the node id of every reachable node other than the
+        source to the node id of its predecessor. Shared, don't modify it.
+        """
+        return self._pred
+
+
+def _tracePath(cg, s, t, pred, as_nodes):
+    """
+    Follows the predecessor map (by node id) back from `t` to `s`. Returns the path as
+    a node list or, like the scan engine, as a list of links ordered from `t` back to `s`.
+    """
+    id_list = _traceIds(s, t, pred)
+    if id_list is None:
+        return None
+    node_list = cg.node_labels(id_list)
+    if as_nodes:
+        return node_list
+    path = []
+    for i in range(len(node_list) - 1, 0, -1):
+        path.append((node_list[i - 1], node_list[i]))
+    return path
+
+
+def _traceIds(s, t, pred):
+    """
+    Follows the predecessor map back from node id `t` to node id `s`. Returns the
+    node ids of the path from `s` to `t`, or None if `t` wasn't reached.
+    """
+    if t != s and t not in pred:
+        return None
+    id_list = [t]
+    while id_list[-1] != s:
+        id_list.append(pred[id_list[-1]])
+    id_list.reverse()
+    return id_list
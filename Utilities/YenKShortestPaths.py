@@ -4,43 +4,77 @@
     for computing shortest paths to allow its use in diverse route computations.
 """
 
-import networkx as nx
 import heapq
-from Utilities import ModifiedDijkstra
+from array import array
+from Utilities.ModifiedDijkstra import ModifiedDijkstra
+from Utilities.CompiledGraph import CompiledGraph
 
 class YenKShortestPaths(object):
     """ This is a straight forward implementation of Yen's K shortest loopless path algorithm.
-        No attempt has been made to perform any optimizations that have been suggested in the literature.
-        Our main goal was to have a functioning K-shortest path  algorithm. This implementation
-        should work for both undirected and directed  graphs. However it has only been tested
+        Apart from masking nodes and edges instead of copying the graph for each spur
+        search, no attempt has been made to perform any optimizations that have been
+        suggested in the literature. Our main goal was to have a functioning K-shortest
+        path algorithm. This implementation should work for both undirected and directed  graphs. However it has only been tested
         so far against undirected graphs.
 
         Parameters
         ----------
         graph : networkx.Graph
-            the graph of interest
+            the graph of interest, or a :class:`CompiledGraph` in which case the weight
+            and capacity attributes are the ones it was compiled with.
         weight : string
             the string used for the link weight (cost) attribute
         cap : string
             the string used for the link capacity attribute
+        engine : string
+            (optional) the :class:`ModifiedDijkstra` engine for the spur searches, e.g.,
+            "astar" for geographic networks whose link weights are distances.
+
+        The first (shortest) path for a source comes from a shortest path tree that is
+        cached per source node, so later calls of findFirstShortestPath with the same
+        source, e.g., for different demands, don't search again. Hence the graph must
+        not be modified while this object is in use.
+
+        When a cost bound is set (see iter_k_shortest) the spur searches only look for
+        spur paths that keep the candidate within the bound. They stop labelling a node
+        once the cost of the root path, the node label and the distance from the node
+        to the destination (from a shortest path tree into the destination, cached per
+        destination) exceed the bound.
     """
 
 
-    def __init__(self, graph, weight="weight", cap="capacity"):
+    def __init__(self, graph, weight="weight", cap="capacity", engine="heap"):
+        if isinstance(graph, CompiledGraph):
+            weight = graph.wt
+            cap = graph.cap
         self.wt = weight
         self.cap = cap
         self.g = graph
         self.pathHeap = [] # Use the heapq module functions heappush(pathHeap, item) and heappop(pathHeap, item)
         self.pathList = [] # Contains WeightedPath objects
+        self.pathHashes = set() # Node tuples of the paths in pathList and pathHeap
+        self.maxCandidates = None # When set, pathHeap is trimmed to this many paths
+        self.maxCost = None # When set, candidates costing more are dropped
         self.deletedEdges = set()
         self.deletedNodes = set()
+        self.spurEdge = None # Edge id from the current spur node to the next in kPath
+        self.destId = None
         self.kPath = None
-        # Make a copy of the graph tempG that we can manipulate
-        if (isinstance(graph, nx.Graph)):
-            self.tempG = graph.copy()
+        self.treeCache = {}  # Shortest path trees indexed by source node
+        self.toDistCache = {}  # Distances to a node, indexed by destination node
+        self.toAlg = None
+        # All searches run on one compiled copy of the graph. Rather than deleting nodes and
+        # edges from a copy of the graph, the spur searches are given node and edge masks.
+        if isinstance(graph, CompiledGraph):
+            self.cg = graph
         else:
-            self.tempG = None
-            
+            self.cg = CompiledGraph(graph, weight, cap)
+        self.alg = ModifiedDijkstra(self.cg, weight, engine="heap")
+        if engine == "heap":
+            self.spurAlg = self.alg
+        else:
+            self.spurAlg = ModifiedDijkstra(self.cg, weight, engine=engine)
+
 
     def findFirstShortestPath(self, source, dest): 
         """ Initialize the k-shortest path algorithm and finds the shortest path.
@@ -63,20 +97,74 @@ class YenKShortestPaths(object):
         self.kPath = None
         self.pathHeap = []
         self.pathList = []
+        self.pathHashes = set()
+        self.maxCandidates = None
+        self.maxCost = None
         self.source = source
         self.dest = dest
-        # Compute the shortest path
-        #nodeList = nx.dijkstra_path(self.g, source, dest, self.wt)
-        alg = ModifiedDijkstra(self.g, self.wt)
-        nodeList = alg.getPath(source, dest, as_nodes = True)
-        if (len(nodeList) == 0):
+        # Get the shortest path from the (cached) shortest path tree of the source
+        tree = self.treeCache.get(source)
+        if tree is None:
+            tree = self.alg.shortest_path_tree(source)
+            self.treeCache[source] = tree
+        self.destId = self.cg.index[dest]
+        idList = tree.getPathIds(self.destId)
+        if idList is None:
             return None;
-        deletedLinks = set()
-        self.kPath = WeightedPath(nodeList, deletedLinks, self.g, wt=self.wt, cap=self.cap);
-        self.kPath.dNode = source
+        self.kPath = WeightedPath.fromIds(idList, None, self.cg, 0);
         self.pathList.append(self.kPath);
+        self.pathHashes.add(self.kPath.key())
         return self.kPath;
 
+    def iter_k_shortest(self, source, dest, k=None, max_cost=None, max_stretch=None):
+        """ Generates the shortest paths from `source` to `dest` in order of increasing cost.
+            Paths are computed lazily: the spur searches for the next path only run when
+            the caller asks for it, so a caller that stops early pays nothing for the
+            paths it never consumes. Restarts the algorithm like findFirstShortestPath.
+
+            Parameters
+            ----------
+            source : string
+               The beginning node of the path.
+            dest : string
+                The termination node of the path.
+            k : integer
+                (optional) the maximum number of paths to generate. Also bounds the
+                candidate heap to the number of paths still needed.
+            max_cost : float
+                (optional) stop before the first path whose cost exceeds this value.
+                Candidates costing more are never put on the candidate heap and the
+                spur searches are pruned accordingly.
+            max_stretch : float
+                (optional) like `max_cost`, with the bound given as a multiple of the
+                shortest path cost, e.g., 1.5 for paths up to 50% longer. If both are
+                given the smaller bound applies.
+
+            Yields
+            ------
+            path : WeightedPath
+                the next shortest path.
+        """
+        if k is not None and k <= 0:
+            return
+        p = self.findFirstShortestPath(source, dest)
+        if p is not None and max_stretch is not None:
+            stretch_cost = p.cost * max_stretch
+            if max_cost is None or stretch_cost < max_cost:
+                max_cost = stretch_cost
+        self.maxCost = max_cost
+        count = 0
+        while p is not None:
+            if max_cost is not None and p.cost > max_cost:
+                return
+            yield p
+            count += 1
+            if k is not None:
+                if count >= k:
+                    return
+                self.maxCandidates = k - count
+            p = self.getNextShortestPath()
+
 
     def getNextShortestPath(self):
         """ Computes successive shortest path.
@@ -96,18 +184,36 @@ class YenKShortestPaths(object):
             raise UserWarning("Must call findFirstShortestPath before this method or no path exists")
         # Iterate over all the nodes in kPath from dNode to the node before the destination
         # and add candidate paths to the path heap.
-        kNodes = self.kPath.nodeList
-        index = kNodes.index(self.kPath.dNode)
-        curNode = kNodes[index]
-        while (curNode != self.dest): 
-            self._removeEdgesNodes(curNode)
-            candidate = self._computeCandidatePath(curNode)
+        kIds = self.kPath.nodeIds
+        toDist = None
+        if self.maxCost is not None:
+            toDist = self._toDist()
+            edgeWeights = self.cg.edge_weights
+            rootCost = 0.0
+            for i in range(self.kPath.dIndex):
+                rootCost += edgeWeights[self.cg.edge_id(kIds[i], kIds[i + 1])]
+        for index in range(self.kPath.dIndex, len(kIds) - 1):
+            limit = None
+            if toDist is not None:
+                if index > self.kPath.dIndex:
+                    rootCost += edgeWeights[self.cg.edge_id(kIds[index - 1], kIds[index])]
+                # Allow for rounding differences with the candidate cost, which is checked
+                # against the bound exactly in _pushCandidate.
+                limit = self.maxCost - rootCost + 1e-9 * (1.0 + abs(self.maxCost))
+                if toDist[kIds[index]] > limit:
+                    continue  # Even the unmasked shortest spur path is too long
+            self._removeEdgesNodes(index)
+            candidate = self._computeCandidatePath(index, limit, toDist)
             self._restoreGraph()
             if (candidate != None):
-                heapq.heappush(self.pathHeap, candidate)
-            index = index + 1
-            curNode = kNodes[index]
-            
+                self._pushCandidate(candidate)
+        # Only the cheapest maxCandidates paths can still be returned
+        if self.maxCandidates is not None and len(self.pathHeap) > self.maxCandidates:
+            keep = heapq.nsmallest(self.maxCandidates, self.pathHeap)
+            for dropped in set(self.pathHeap).difference(keep):
+                self.pathHashes.discard(dropped.key())
+            self.pathHeap = keep  # A sorted list satisfies the heap invariant
+
         if (len(self.pathHeap) == 0):
             return None;
         p = heapq.heappop(self.pathHeap) # after iterations contains next shortest path
@@ -115,126 +221,170 @@ class YenKShortestPaths(object):
         self.kPath = p     # updates the kth path
         return p;
 
-    def _removeEdgesNodes(self, curNode):
+    def _toDist(self):
+        """
+        Returns the (unmasked) distances from every node id to the destination, which
+        bound the cost of any spur path from below.
+        """
+        toDist = self.toDistCache.get(self.dest)
+        if toDist is None:
+            if self.cg.directed:
+                if self.toAlg is None:
+                    self.toAlg = ModifiedDijkstra(self.cg.reversed(), self.wt, engine="heap")
+                tree = self.toAlg.shortest_path_tree(self.dest)
+            else:
+                tree = self.alg.shortest_path_tree(self.dest)
+                self.treeCache[self.dest] = tree
+            toDist = tree.getDistIds()
+            self.toDistCache[self.dest] = toDist
+        return toDist
+
+    def _pushCandidate(self, candidate):
+        """
+        Puts a candidate path on the path heap unless the same path is already
+        known or it costs more than the cost bound.
+        """
+        if self.maxCost is not None and candidate.cost > self.maxCost:
+            return
+        key = candidate.key()
+        if key in self.pathHashes:
+            return
+        self.pathHashes.add(key)
+        heapq.heappush(self.pathHeap, candidate)
+
+    def _removeEdgesNodes(self, index):
         """
-        Remove all nodes from source to the node before the current node in kPath.
-        Delete the edge between curNode and the next node in kPath
-        Delete any edges previously deleted in kPath starting at curNode
-        add all deleted edges to the deleted edge list.
+        Block all nodes from source to the node before the current node (at position
+        `index`) in kPath. Block the edge between the current node and the next node in
+        kPath. Block any edges previously deleted in kPath starting at the current node
+        add all blocked edges to the deleted edge list.
+
+        Nothing is removed from the graph, the node and edge ids of the compiled graph
+        are collected in deletedNodes and deletedEdges and the spur search skips them.
         """
-        # Figure out all edges to be removed first then take them out of the temp graph
-        # then remove all the nodes from the temp graph.
-        # At the start the temp graph is equal to the initial graph.
+        kIds = self.kPath.nodeIds
+        # The root nodes take all their edges with them so we don't record those edges.
+        self.deletedNodes = set(kIds[0:index])
         self.deletedEdges = set()
-        self.deletedNodes = set()
-        kNodes = self.kPath.nodeList
-        index = 0
-        tempNode = kNodes[index]
-        index += 1
-        while (tempNode != curNode):
-            edges = self.tempG.edges(tempNode)
-            if (len(edges) != 0): 
-                for edge in edges:
-                    self.deletedEdges.add(edge)
-                    self.tempG.remove_edge(edge[0], edge[1])
-            #
-            self.deletedNodes.add(tempNode)
-            self.tempG.remove_node(tempNode)
-            tempNode = kNodes[index]
-            index += 1
-        # Also need to remove those old deleted edges that start on curNode
-        oldDelEdges = self.kPath.deletedEdges
-        if self.g.is_directed():
-            outEdges = self.g.out_edges(curNode)
-        else:
-            outEdges = self.g.edges(curNode)
-        #outEdges = self.g.edges(curNode)
-        for  e in outEdges:
-            if (e in oldDelEdges):
-                self.deletedEdges.add(e)
-                self.tempG.remove_edge(e[0], e[1])
-        
-        # Now delete the edge from the curNode to the next in the path
-        tempNode = kNodes[index]
-        e = (curNode, tempNode)
-        self.deletedEdges.add(e)
-        self.tempG.remove_edge(curNode, tempNode)
-
-    
-    def _computeCandidatePath(self, curNode):
-        """
-        Compute the shortest path on the modified graph and then
+        # Also need to block those old deleted edges that start on the current node.
+        # These are only recorded at the deflection node of kPath, all nodes before
+        # it are blocked.
+        if index == self.kPath.dIndex:
+            self.deletedEdges.update(self.kPath.deletedEdges)
+        # Now block the edge from the current node to the next in the path
+        self.spurEdge = self.cg.edge_id(kIds[index], kIds[index + 1])
+        self.deletedEdges.add(self.spurEdge)
+
+    def _computeCandidatePath(self, index, limit=None, toDist=None):
+        """
+        Compute the shortest path on the masked graph and then
         combines with the portion of kPath from the source up through
-        the deviation node
-        """
-#        DijkstraShortestPath alg = new DijkstraShortestPath(tempG, wt);
-#        List<E> ePath = alg.getPath(curNode, dest);
-        
-        #nodeList = nx.dijkstra_path(self.tempG, curNode, self.dest, self.wt)
-        alg = ModifiedDijkstra(self.tempG, self.wt)
-        nodeList = alg.getPath(curNode, self.dest, as_nodes = True)
-        # Trying this out...
-        if nodeList == None:
+        the deviation node. With a `limit` only spur paths costing at most
+        that much are searched for.
+        """
+        kIds = self.kPath.nodeIds
+        spurIds = self.spurAlg.getPathIds(kIds[index], self.destId,
+                                          blocked_nodes=self.deletedNodes,
+                                          blocked_edges=self.deletedEdges,
+                                          limit=limit, to_dist=toDist)
+        if spurIds == None:
             return None
+        # The deleted edges are shared with kPath when deviating at its deflection node
+        if index == self.kPath.dIndex:
+            deleted = (self.spurEdge, self.kPath.deleted)
+        else:
+            deleted = (self.spurEdge, None)
+        return WeightedPath.fromIds(kIds[0:index].tolist() + spurIds, deleted, self.cg, index)
 
-        
-        # Get first part of the path from kPath
-        nodePath = []
-        if (curNode in self.kPath.nodeList):
-            index = self.kPath.nodeList.index(curNode)
-            nodePath = self.kPath.nodeList[0:index]
-
-        nodePath.extend(nodeList)
-        wp = WeightedPath(nodePath, self.deletedEdges, self.g, wt=self.wt, cap=self.cap)
-        wp.dNode = curNode
-        return wp
-    
     def _restoreGraph(self):
         """
-        Using the internal deleted node and deleted edge containers
-        restores the temp graph to match the graph g.
+        Clears the internal deleted node and deleted edge containers so that
+        the next spur search sees the whole graph g again.
         """
-        self.tempG = self.g.copy()
-        self.deletedEdges = []
-        self.deletedNodes = []
-    
-    
+        self.deletedEdges = set()
+        self.deletedNodes = set()
+
+
 class WeightedPath(object):
     """ Used internally by the Yen k-shortest path algorithm and returned to user as a result.
         Useful members: nodeList, cost, and capacity.
 
+        To keep large numbers of candidate paths cheap the path is stored as a compact
+        array of node ids together with the node labels of the compiled graph (shared by
+        all paths), without any reference to the graph itself. Cost and capacity are
+        computed once on construction.
+
         Parameters
         ----------
         pathNodeList : list
             a list containing the nodes in the path
         deletedEdges : list
-            Use internally by the Yen algorithm
+            Use internally by the Yen algorithm (edge ids deleted at the deflection node)
         g : networkx.Graph
-            the graph
+            the graph, or a :class:`CompiledGraph` holding the link weights and capacities
     """
+    __slots__ = ("nodeIds", "labels", "deleted", "dIndex", "cost", "capacity")
+
     def __init__(self, pathNodeList, deletedEdges, g, wt='weight', cap='capacity'):
         """
         Constructor
         """
-        self.nodeList = pathNodeList
-        self.deletedEdges = set(deletedEdges)
-        self.g = g
-        self.wt = wt
-        self.dNode = None   # The deflection node
-        self.cost = 0.0
-        self.capacity = float("inf")
-        #print "WtPath pathNodeList: {}".format(pathNodeList)
-        for i in range(len(pathNodeList)-1):
-            self.cost = self.cost + g[pathNodeList[i]][pathNodeList[i+1]][wt]
-            if not cap == None:
-                self.capacity = min(self.capacity, g[pathNodeList[i]][pathNodeList[i+1]][cap])
-            else:
-                self.capacity = None
-        
-    def __cmp__(self, other):
-        if other == None:
-            return -1
-        return cmp(self.cost, other.cost)
-    
+        if not isinstance(g, CompiledGraph):
+            g = CompiledGraph(g, wt, cap)
+        deleted = None
+        for e in deletedEdges:
+            deleted = (e, deleted)
+        self._setup(g.node_ids(pathNodeList), deleted, g, 0)
+
+    @classmethod
+    def fromIds(cls, idList, deleted, cg, dIndex):
+        """
+        Creates a path from node ids of the compiled graph `cg`. The deleted edges are
+        a chain of (edge id, rest of chain) tuples so that a candidate can share the
+        edges deleted by its parent path. `dIndex` is the position of the deflection node.
+        """
+        wp = cls.__new__(cls)
+        wp._setup(idList, deleted, cg, dIndex)
+        return wp
+
+    def _setup(self, idList, deleted, cg, dIndex):
+        self.nodeIds = array('i', idList)
+        self.labels = cg.nodes
+        self.deleted = deleted
+        self.dIndex = dIndex  # Position of the deflection node in the path
+        self.cost, self.capacity = cg.path_metrics_ids(self.nodeIds)
+
+    @property
+    def nodeList(self):
+        """ The path as a list of nodes. """
+        labels = self.labels
+        return [labels[i] for i in self.nodeIds]
+
+    @property
+    def dNode(self):
+        """ The deflection node. """
+        return self.labels[self.nodeIds[self.dIndex]]
+
+    @property
+    def deletedEdges(self):
+        """ The ids of the edges deleted at the deflection node. """
+        edges = set()
+        link = self.deleted
+        while link is not None:
+            edges.add(link[0])
+            link = link[1]
+        return edges
+
+    def key(self):
+        """ A hashable key identifying the path. """
+        return self.nodeIds.tobytes()
+
+    def __lt__(self, other):
+        # Equal cost paths are ordered by their node ids so that the k-shortest paths
+        # don't depend on the order in which candidates happened to be found.
+        if self.cost != other.cost:
+            return self.cost < other.cost
+        return self.nodeIds < other.nodeIds
+
     def __str__(self):
         return "nodeList: {}, cost: {}, capacity: {}".format(self.nodeList, self.cost, self.capacity)
@@ -0,0 +1,186 @@
+""" All-pairs shortest path distances and next hops as dense NumPy matrices.
+    Useful for full-mesh traffic where every ordered node pair is a demand: one batch
+    computation replaces a Dijkstra search per demand pair. Small or dense graphs use a
+    vectorized Floyd-Warshall algorithm, large sparse graphs a heap Dijkstra search from
+    every node over the compiled (CSR) graph.
+"""
+import numpy as np
+from Utilities.CompiledGraph import CompiledGraph
+from Utilities.ModifiedDijkstra import ModifiedDijkstra
+
+
+class AllPairsPaths(object):
+    """ All-pairs shortest path distances and next hops, as returned by
+        :func:`all_pairs_shortest_paths`. Useful members: nodes, index, dist and next_hop.
+
+        `dist[i, j]` is the length of a shortest path from node id i to node id j (inf if
+        there is none) and `next_hop[i, j]` the node id following i on that path (-1 if
+        there is none). Node ids are positions in `nodes`, and `index` maps node labels
+        to ids.
+    """
+    def __init__(self, nodes, index, dist, next_hop):
+        self.nodes = nodes
+        self.index = index
+        self.dist = dist
+        self.next_hop = next_hop
+
+    def distance(self, source, dest):
+        """ Returns the shortest path length from `source` to `dest`. """
+        return self.dist[self.index[source], self.index[dest]]
+
+    def getPath(self, source, dest, as_nodes=True):
+        """ Reconstructs a shortest path from the next hop matrix.
+
+            Parameters
+            ----------
+            source, dest : strings
+                The source and destination node identifiers.
+            as_nodes : boolean
+                return the path as a list of nodes (default) or as a list of links.
+
+            Returns
+            -------
+            path : list
+                the path, or None if `dest` can't be reached from `source`.
+        """
+        ids = path_from_next_hop(self.next_hop, self.index[source], self.index[dest])
+        if ids is None:
+            return None
+        node_list = [self.nodes[i] for i in ids]
+        if as_nodes:
+            return node_list
+        return [(node_list[i], node_list[i + 1]) for i in range(len(node_list) - 1)]
+
+
+def path_from_next_hop(next_hop, s, t):
+    """ Follows a next hop matrix from node id `s` to node id `t`.
+
+        Returns
+        -------
+        ids : list
+            the node ids of the path, or None if there is no path.
+    """
+    if next_hop[s, t] < 0:
+        return None
+    ids = [s]
+    while s != t:
+        s = next_hop[s, t]
+        ids.append(int(s))
+    return ids
+
+
+def all_pairs_shortest_paths(g, wt="weight", method="auto"):
+    """ Computes shortest path distances and next hops between all ordered node pairs.
+
+        Parameters
+        ----------
+        g : networkx.Graph
+            a directed or undirected graph, or a :class:`CompiledGraph`.
+        wt : string
+            (optional) the link weight attribute.
+        method : string
+            (optional) "floyd_warshall", "dijkstra" or "auto" (default) which picks
+            Floyd-Warshall for small or dense graphs and Dijkstra otherwise.
+
+        Returns
+        -------
+        paths : AllPairsPaths
+            the distance and next hop matrices.
+    """
+    if isinstance(g, CompiledGraph):
+        cg = g
+    else:
+        cg = CompiledGraph(g, wt)
+    n = cg.num_nodes()
+    if method == "auto":
+        if n <= 256 or len(cg.indices) >= n * n // 8:
+            method = "floyd_warshall"
+        else:
+            method = "dijkstra"
+    if method == "floyd_warshall":
+        dist, next_hop = floyd_warshall(cg)
+    elif method == "dijkstra":
+        dist, next_hop = repeated_dijkstra(cg)
+    else:
+        raise ValueError("Unknown method {}".format(method))
+    return AllPairsPaths(cg.nodes, cg.index, dist, next_hop)
+
+
+def floyd_warshall(cg):
+    """ Vectorized Floyd-Warshall algorithm on a compiled graph. Handles negative link
+        weights as long as there are no negative cycles.
+
+        Returns
+        -------
+        dist, next_hop : numpy.ndarray
+            the n by n distance and next hop matrices.
+    """
+    n = cg.num_nodes()
+    dist = np.full((n, n), np.inf)
+    next_hop = np.full((n, n), -1, dtype=np.int64)
+    tails = np.repeat(np.arange(n), np.diff(np.asarray(cg.indptr)))
+    heads = np.asarray(cg.indices, dtype=np.int64)
+    weights = np.asarray(cg.weights)
+    # Keep the cheapest arc between a pair of nodes, by writing the cheapest last
+    order = np.argsort(-weights, kind="stable")
+    dist[tails[order], heads[order]] = weights[order]
+    next_hop[tails[order], heads[order]] = heads[order]
+    diag = np.arange(n)
+    dist[diag, diag] = np.minimum(dist[diag, diag], 0.0)
+    next_hop[diag, diag] = diag
+    for k in range(n):
+        cand = dist[:, k:k + 1] + dist[k:k + 1, :]
+        better = cand < dist
+        dist = np.where(better, cand, dist)
+        next_hop = np.where(better, next_hop[:, k:k + 1], next_hop)
+    return dist, next_hop
+
+
+def repeated_dijkstra(cg):
+    """ Runs a heap Dijkstra search from every node of a compiled graph and derives the
+        next hops from each shortest path tree by pointer jumping.
+
+        Returns
+        -------
+        dist, next_hop : numpy.ndarray
+            the n by n distance and next hop matrices.
+    """
+    n = cg.num_nodes()
+    alg = ModifiedDijkstra(cg, cg.wt, engine="heap")
+    dist = np.empty((n, n))
+    next_hop = np.full((n, n), -1, dtype=np.int64)
+    nodes = np.arange(n)
+    for s in range(n):
+        d, pred = alg._heapSearch(s, -1)
+        dist[s] = d
+        # Make the children of s the roots of their subtrees, jumping to the root then
+        # gives the first hop. Unreached nodes point at themselves.
+        parent = nodes.copy()
+        if len(pred) > 0:
+            children = np.fromiter(pred.keys(), dtype=np.int64, count=len(pred))
+            parents = np.fromiter(pred.values(), dtype=np.int64, count=len(pred))
+            keep = parents != s
+            parent[children[keep]] = parents[keep]
+        while True:
+            jumped = parent[parent]
+            if np.array_equal(jumped, parent):
+                break
+            parent = jumped
+        reached = np.isfinite(dist[s])
+        next_hop[s, reached] = parent[reached]
+        next_hop[s, s] = s
+    return dist, next_hop
+
+
+if __name__ == "__main__":
+    import time
+    import networkx as nx
+
+    g = nx.random_geometric_graph(300, 0.1, seed=5).to_directed()
+    for e in g.edges():
+        g[e[0]][e[1]]["weight"] = 1.0 + (e[0] * 7 + e[1] * 3) % 10
+    for method in ["floyd_warshall", "dijkstra"]:
+        tic = time.time()
+        ap = all_pairs_shortest_paths(g, method=method)
+        print("{}: {:.3f} seconds".format(method, time.time() - tic))
+    print("Path 0 -> 1: {}, distance {}".format(ap.getPath(0, 1), ap.distance(0, 1)))
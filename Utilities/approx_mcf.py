@@ -0,0 +1,353 @@
+""" Approximate multicommodity flows without an LP solver.
+    The Garg-Konemann method, in Fleischer's and Karakostas's form, routes the demands
+    over and over along shortest paths for link lengths that grow exponentially with the
+    link loads, so that congested links become expensive. Each round only needs shortest
+    path trees, one per demand source, computed with :class:`ModifiedDijkstra`.
+
+    The link lengths also are dual solutions, which gives a bound on the optimum at every
+    round: the solvers below stop once the feasible flow found is provably within the
+    accuracy `eps` of the optimum, or when they run out of rounds, and report the flow
+    and the bound so the gap is known.
+"""
+from math import exp, log, sqrt
+import numpy as np
+from Utilities.CompiledGraph import CompiledGraph
+from Utilities.ModifiedDijkstra import ModifiedDijkstra
+
+
+class ApproxMCF(object):
+    """ Approximately solves the maximum concurrent flow and the minimum cost
+        multicommodity flow problems on a directed network.
+
+        After :meth:`max_concurrent` or :meth:`min_cost` the member `flow` holds the link
+        flows of each demand as an array indexed by (link id, demand index), in the
+        order of `link_list` and `demand_list`, and :meth:`link_flows` gives them as a
+        dictionary indexed by (link, demand) like the flow variables of
+        BasicNodeLinkFormulation.py, to use with
+        :func:`Utilities.flow_paths.getDemandLinks`.
+
+        Parameters
+        ----------
+        g : networkx.DiGraph
+            a directed network graph.
+        demands : dictionary
+            a dictionary of demand volumes indexed by node pairs.
+        wt : string
+            (optional) the link cost attribute.
+        cap : string
+            (optional) the link capacity attribute.
+        eps : float
+            (optional) the accuracy, e.g., 0.1 for solutions within about 10% of the
+            optimum. The running time grows with 1/eps**2.
+    """
+    def __init__(self, g, demands, wt="weight", cap="capacity", eps=0.1):
+        if not g.is_directed():
+            raise ValueError("ApproxMCF needs a directed graph")
+        self.eps = eps
+        self.cg = CompiledGraph(g, wt, cap)
+        if eps < _smallest_eps(self.cg.num_edges() + 1):
+            raise ValueError("eps {} is too small for {} links".format(eps, self.cg.num_edges()))
+        self.link_list = list(self.cg.edges)
+        self.cost = np.array(self.cg.edge_weights, dtype=float)
+        self.caps = np.array(self.cg.edge_caps, dtype=float)
+        self.demand_list = sorted(d for d in demands.keys() if d[0] != d[1] and demands[d] > 0)
+        self.volume = np.array([demands[d] for d in self.demand_list], dtype=float)
+        # Demands grouped by source: source node id -> (demand indices, sink node ids)
+        self.by_source = {}
+        for k, d in enumerate(self.demand_list):
+            s = self.cg.index[d[0]]
+            self.by_source.setdefault(s, ([], []))
+            self.by_source[s][0].append(k)
+            self.by_source[s][1].append(self.cg.index[d[1]])
+        self.flow = None
+        self.objective = None  # Cost of the flow found by min_cost
+        self.lower = None
+        self.upper = None
+        self.phases = 0
+
+    def max_concurrent(self, budget=None, max_phases=100000):
+        """ Finds the largest fraction `lambda` such that `lambda` times every demand can
+            be routed within the link capacities (and, if given, for a total cost of at
+            most `budget`).
+
+            Returns
+            -------
+            lambda : float
+                the fraction routed by `flow`, within a factor (1 - eps) of the bound
+                kept in `upper` unless `max_phases` ran out. Zero if there are no demands
+                or some demand can't be routed at all.
+        """
+        if len(self.demand_list) == 0:
+            self.flow = np.zeros((len(self.link_list), 0))
+            self.lower = self.upper = 0.0
+            self.phases = 0
+            return 0.0
+        lam, flow, routed, lengths, phi = self._concurrent(budget, max_phases, self.eps)
+        if lam > 0:
+            # Keep exactly lambda times each demand
+            self.flow = flow * (lam * self.volume / routed)
+        else:
+            self.flow = np.zeros((len(self.link_list), len(self.demand_list)))
+        return lam
+
+    def min_cost(self, max_rounds=50):
+        """ Finds a minimum cost routing of all the demands within the link capacities.
+            If routing each demand on its cheapest path fits the capacities, that routing
+            is optimal. Otherwise a search on the cost budget of the maximum concurrent
+            flow problem narrows an interval known to hold the minimum cost: a budget
+            within which all demands get routed gives a routing and an upper bound, one
+            for which the dual bound shows they can't be gives a lower bound, and so do
+            the final link lengths used as capacity prices. Budgets that are neither, and
+            an undecided feasibility check, are tried again at a finer accuracy, down to
+            eps / 8.
+
+            Parameters
+            ----------
+            max_rounds : integer
+                (optional) the maximum number of budgets tried.
+
+            Returns
+            -------
+            status : string
+                "Optimal" if `flow` routes all demands for a cost, in `objective`, within
+                a factor (1 + eps) of the lower bound on the minimum cost in `lower`.
+                "Not Solved" if max_rounds ran out first, or a budget was still undecided
+                at the finest accuracy, with `flow` still routing all demands and the
+                cost between `lower` and `upper`. "Infeasible" if the demands provably
+                can't be routed, and "Undefined" if that couldn't be decided at the finest
+                accuracy, in both cases with `flow` and `objective` None.
+        """
+        eps = self.eps
+        self.flow = None
+        self.objective = None
+        # Without the capacities every demand would take its cheapest path
+        lo, best = self._cheapest_routing()
+        if lo == float("inf"):
+            return "Infeasible"
+        if np.all(best.sum(axis=1) <= self.caps * (1.0 + 1e-9)):
+            self.flow = best
+            self.objective = self.lower = self.upper = lo
+            return "Optimal"
+        search_eps = eps
+        min_eps = max(eps / 8.0, _smallest_eps(len(self.link_list) + 1))
+        lam, flow, routed, lengths, phi = self._concurrent(None, 100000, search_eps)
+        while lam < 1.0 and self.upper >= 1.0 and search_eps > min_eps:
+            search_eps = max(0.5 * search_eps, min_eps)  # Undecided at this accuracy
+            lam, flow, routed, lengths, phi = self._concurrent(None, 100000, search_eps)
+        if lam < 1.0:
+            return "Infeasible" if self.upper < 1.0 else "Undefined"
+        best = flow * (self.volume / routed)
+        hi = float(self.cost.dot(best.sum(axis=1)))
+        rounds = 0
+        while hi > (1.0 + eps) * lo and rounds < max_rounds:
+            rounds += 1
+            budget = sqrt(lo * hi) if lo > 0 else 0.5 * hi
+            lam, flow, routed, lengths, phi = self._concurrent(budget, 100000, search_eps)
+            lo = max(lo, self._cost_bound(lengths / phi))
+            if lam >= 1.0:
+                # Routes the demands for at most the budget, which is below hi
+                flow = flow * (self.volume / routed)
+                cost = float(self.cost.dot(flow.sum(axis=1)))
+                if cost < hi:
+                    best, hi = flow, cost
+            elif self.upper < 1.0:
+                lo = max(lo, budget)  # The demands can't all be routed within the budget
+            elif search_eps > min_eps:
+                search_eps = max(0.5 * search_eps, min_eps)  # Undecided at this accuracy
+            else:
+                break  # Undecided even at the finest accuracy
+        self.flow = best
+        self.objective = hi
+        self.lower = lo
+        self.upper = hi
+        return "Optimal" if hi <= (1.0 + eps) * lo else "Not Solved"
+
+    def link_flows(self):
+        """ Returns the flows as a dictionary indexed by (link, demand) pairs. """
+        flows = {}
+        for j, link in enumerate(self.link_list):
+            for k, d in enumerate(self.demand_list):
+                flows[link, d] = float(self.flow[j, k])
+        return flows
+
+    def _cost_bound(self, prices):
+        """ A lower bound on the cost of routing the demands within the capacities from
+            link prices: for any prices y >= 0 the cost is at least the cost of the
+            cheapest routing for link costs w + y, minus the sum of y times the capacity.
+            Tries a few multiples of the prices and returns the best bound.
+        """
+        bound = 0.0
+        for t in [0.5, 1.0, 2.0]:
+            bound = max(bound, self._alpha(self.cost + t * prices) - t * prices.dot(self.caps))
+        return bound
+
+    def _alpha(self, lengths):
+        """ The cost of routing all demands on shortest paths for the link `lengths`. """
+        alg = ModifiedDijkstra(self.cg.reweighted(lengths), self.cg.wt, engine="heap")
+        total = 0.0
+        for s, (ks, sinks) in self.by_source.items():
+            dist = alg.shortest_path_tree(self.cg.nodes[s]).getDistIds()
+            for k, t in zip(ks, sinks):
+                total += self.volume[k] * dist[t]
+        return total
+
+    def _cheapest_routing(self):
+        """ Routes all demands on their cheapest paths, ignoring the capacities. Returns
+            the cost, infinite if some demand can't be routed, and the flows.
+        """
+        flow = np.zeros((len(self.link_list), len(self.demand_list)))
+        total = 0.0
+        for s, (ks, sinks) in self.by_source.items():
+            dist, pred_edge = self._tree(self.cost, s)
+            for k, t in zip(ks, sinks):
+                if dist[t] == float("inf"):
+                    return float("inf"), flow
+                total += self.volume[k] * dist[t]
+                v = t
+                while v != s:
+                    v, e = pred_edge[v]
+                    flow[e, k] += self.volume[k]
+        return total, flow
+
+    def _tree(self, lengths, s):
+        """ Shortest path tree from node id `s`: distances and the edge id to each
+            node's predecessor.
+        """
+        alg = ModifiedDijkstra(self.cg.reweighted(lengths), self.cg.wt, engine="heap")
+        tree = alg.shortest_path_tree(self.cg.nodes[s])
+        pred_edge = {}
+        for v, u in tree.getPredIds().items():
+            pred_edge[v] = (u, self.cg.edge_id(u, v))
+        return tree.getDistIds(), pred_edge
+
+    def _concurrent(self, budget, max_phases, eps):
+        """ Fleischer's maximum concurrent flow algorithm with Karakostas's grouping of
+            the demands by source, at accuracy `eps`. Returns the fraction routed, the
+            unscaled flows, the volume routed per demand, and the final link lengths and
+            budget length. Sets `lower`, `upper` and `phases`.
+        """
+        n_links = len(self.link_list)
+        usable = self.caps > 0
+        if budget is not None and budget <= 0:
+            usable &= self.cost <= 0  # A zero budget only leaves the free links
+            budget = None
+        n_rows = n_links + (1 if budget is not None else 0)
+        # delta = (1 + eps) / ((1 + eps) n_rows)^(1 / eps), whose power overflows for small eps
+        delta = exp(log(1.0 + eps) - log((1.0 + eps) * n_rows) / eps)
+        inf = float("inf")
+        lengths = np.where(usable, delta / np.where(usable, self.caps, 1.0), inf)
+        phi = delta / budget if budget is not None else 0.0
+        flow = np.zeros((n_links, len(self.demand_list)))
+        routed = np.zeros(len(self.demand_list))
+        load = np.zeros(n_links)
+        spent = 0.0
+        self.lower = 0.0
+        self.upper = inf
+        # Scale the demands so that a phase routes about as much as the shortest path
+        # routing congestion allows
+        scale = None
+        self.phases = 0
+        done = False
+        while not done and self.phases < max_phases:
+            for s, (ks, sinks) in self.by_source.items():
+                remaining = self.volume[ks] * (scale if scale is not None else 1.0)
+                while remaining.sum() > 0:
+                    dist, pred_edge = self._tree(lengths + phi * self.cost, s)
+                    tree_flow = np.zeros(n_links)
+                    paths = []
+                    for r, t in zip(remaining, sinks):
+                        if dist[t] == inf:
+                            self.upper = 0.0
+                            return 0.0, flow, routed, lengths, phi
+                        edges = []
+                        v = t
+                        while v != s:
+                            v, e = pred_edge[v]
+                            edges.append(e)
+                        paths.append(edges)
+                        tree_flow[edges] += r
+                    used = self.cost.dot(tree_flow)
+                    if scale is None:
+                        # First tree of the first phase: shortest paths for 1/c lengths
+                        rho = max(np.max(tree_flow[usable] / self.caps[usable], initial=0.0),
+                                  used / budget if budget is not None else 0.0)
+                        if rho > 0:
+                            scale = 1.0 / rho
+                            remaining = remaining * scale
+                            tree_flow *= scale
+                            used *= scale
+                        else:
+                            scale = 1.0
+                    sigma = max(np.max(tree_flow[usable] / self.caps[usable], initial=0.0),
+                                used / budget if budget is not None else 0.0)
+                    frac = 1.0 if sigma <= 1.0 else 1.0 / sigma
+                    for k, r, edges in zip(ks, remaining, paths):
+                        flow[edges, k] += r * frac
+                        routed[k] += r * frac
+                    tree_flow *= frac
+                    load += tree_flow
+                    spent += used * frac
+                    lengths[usable] *= 1.0 + eps * tree_flow[usable] / self.caps[usable]
+                    if budget is not None:
+                        phi *= 1.0 + eps * used * frac / budget
+                    remaining = remaining * (1.0 - frac)
+                    if frac == 1.0:
+                        remaining[:] = 0.0
+                    if lengths[usable].dot(self.caps[usable]) + phi * (budget or 0.0) >= 1.0:
+                        done = True
+                        break
+                if done:
+                    break
+            if not done:
+                self.phases += 1
+            # The fraction routed by the flow scaled down to fit, and the dual bound
+            congestion = max(np.max(load[usable] / self.caps[usable], initial=0.0),
+                             spent / budget if budget is not None else 0.0)
+            lam = np.min(routed / self.volume) / congestion if congestion > 0 else 0.0
+            self.lower = max(self.lower, lam)
+            total = lengths[usable].dot(self.caps[usable]) + phi * (budget or 0.0)
+            self.upper = min(self.upper, total / self._alpha(lengths + phi * self.cost))
+            if self.lower >= (1.0 - eps) * self.upper:
+                break
+        congestion = max(np.max(load[usable] / self.caps[usable], initial=0.0),
+                         spent / budget if budget is not None else 0.0)
+        lam = np.min(routed / self.volume) / congestion if congestion > 0 else 0.0
+        return lam, flow / congestion, routed / congestion, lengths, phi
+
+
+def _smallest_eps(n_rows):
+    """ The smallest accuracy for which the initial link lengths of the concurrent flow
+        algorithm, delta divided by the capacities, stay well clear of floating point
+        underflow.
+    """
+    return log(2.0 * n_rows) / 600.0
+
+
+if __name__ == "__main__":
+    import time
+    from BasicNodeLinkFormulationNSFtopology import create_nsf_topology
+    from Utilities.sparse_lp import node_link_lp
+    from Utilities.flow_paths import getDemandLinks
+
+    g = create_nsf_topology()
+    nodes = sorted(g.nodes())
+    demands = {}
+    for a in nodes:
+        for z in nodes:
+            if a != z:
+                demands[a, z] = 0.05
+    for eps in [0.2, 0.1, 0.05]:
+        mcf = ApproxMCF(g, demands, eps=eps)
+        tic = time.time()
+        lam = mcf.max_concurrent()
+        print("eps {}: concurrent flow {:.4f} (upper bound {:.4f}) in {:.2f} seconds".format(
+            eps, lam, mcf.upper, time.time() - tic))
+        tic = time.time()
+        status = mcf.min_cost()
+        print("    min cost {}: {:.4f} (lower bound {:.4f}) in {:.2f} seconds".format(
+            status, mcf.objective, mcf.lower, time.time() - tic))
+    lp = node_link_lp(g, demands)
+    lp.solve()
+    print("LP: {}, min cost {:.4f}".format(lp.status, lp.objective))
+    d_links = getDemandLinks(demands, mcf.link_list, mcf.link_flows())
+    print(d_links[1, 2])
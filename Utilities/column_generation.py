@@ -0,0 +1,201 @@
+""" Column generation for the link-path formulation of the capacitated network design
+    problem. Instead of solving over a fixed set of candidate paths, the driver starts
+    with the shortest path of each demand and prices new paths with a shortest path
+    search on link weights adjusted by the duals of the link capacity constraints,
+    adding paths until none has a negative reduced cost. The restricted problem is built
+    once, with PuLP's column-wise modelling, and each new path is added as a column of
+    its existing constraints. The final problem is the one BasicLinkPathFormulation.py
+    would build for the generated paths (plus unserved demand variables fixed to zero),
+    which then are an optimal set of candidate paths.
+"""
+from pulp import LpProblem, LpMinimize, LpVariable, LpStatus, LpContinuous, LpConstraintVar
+from pulp import LpConstraintLE, LpConstraintEQ
+from Utilities.CompiledGraph import CompiledGraph
+from Utilities.ModifiedDijkstra import ModifiedDijkstra
+
+
+class LinkPathColumnGeneration(object):
+    """ Solves the link-path formulation by column generation.
+
+        Useful members after :meth:`solve`: status, prob (the final PuLP problem),
+        demand_paths (its path variables indexed by (demand, path number)), paths (the
+        generated paths per demand as node lists) and iterations.
+
+        Parameters
+        ----------
+        g : networkx.Graph
+            the network graph, like the one read in BasicLinkPathFormulation.py.
+        demands : dictionary
+            a dictionary of demands indexed by node pairs.
+        wt : string
+            (optional) the link attribute used as the path cost. By default the cost of a
+            path is its number of hops, as in BasicLinkPathFormulation.py.
+        cap : string
+            (optional) the link capacity attribute.
+        solver : pulp solver
+            (optional) the solver passed to LpProblem.solve, it must return duals.
+
+        As in BasicLinkPathFormulation.py a path loads the capacity constraint of a link
+        when it uses the link in either direction.
+    """
+    def __init__(self, g, demands, wt=None, cap="capacity", solver=None):
+        self.g = g
+        self.demands = demands
+        self.cap = cap
+        self.solver = solver
+        self.demand_list = sorted(demands.keys())
+        self.link_list = sorted(g.edges())
+        link_row = {}
+        for i, link in enumerate(self.link_list):
+            link_row[link] = i
+        self.link_row = link_row
+        # Compile once, the pricing searches only change the link weights
+        self.cg = CompiledGraph(g, wt, cap)
+        self.cost = list(self.cg.edge_weights)
+        # The capacity rows each edge (in the direction of the compiled arcs) is part of
+        self.edge_rows = []
+        for e in self.cg.edges:
+            rows = set()
+            for link in [(e[0], e[1]), (e[1], e[0])]:
+                if link in link_row:
+                    rows.add(link_row[link])
+            self.edge_rows.append(sorted(rows))
+        self.paths = {}
+        self.prob = None
+        self.demand_paths = {}
+        self.status = "Not Solved"
+        self.iterations = 0
+
+    def solve(self, max_iter=1000, tol=1e-9):
+        """ Runs column generation and solves the final problem.
+
+            Parameters
+            ----------
+            max_iter : integer
+                (optional) the maximum number of pricing rounds.
+            tol : float
+                (optional) paths are added if their reduced cost is below -tol.
+
+            Returns
+            -------
+            status : string
+                the PuLP status string of the final problem, e.g., "Optimal" or
+                "Infeasible".
+        """
+        # Unserved demand variables with a cost above that of any path keep the
+        # restricted problems feasible while there are too few paths
+        self._build(1.0 + sum(abs(c) for c in self.cost))
+        # Start with a shortest path per demand
+        for d, node_list in self._price(self.cost, None, tol):
+            self._add_path(d, node_list)
+        self.iterations = 0
+        while self.iterations < max_iter:
+            self.iterations += 1
+            self.prob.solve(self.solver)
+            if LpStatus[self.prob.status] != "Optimal":
+                break
+            # Reduced cost of a path for demand d: sum over its links of (cost - cap dual),
+            # minus the demand dual
+            weights = []
+            for e, rows in enumerate(self.edge_rows):
+                w = self.cost[e] - sum(self.cap_rows[i].constraint.pi for i in rows)
+                weights.append(max(w, self.cost[e]))  # Capacity duals are never positive
+            sigma = {}
+            for d in self.demand_list:
+                sigma[d] = self.sat_rows[d].constraint.pi
+            added = 0
+            for d, node_list in self._price(weights, sigma, tol):
+                if node_list not in self.paths[d]:
+                    self._add_path(d, node_list)
+                    added += 1
+            if added == 0:
+                break
+        # The final problem has to serve all demands
+        for var in self.unserved:
+            var.upBound = 0
+        self.prob.solve(self.solver)
+        self.status = LpStatus[self.prob.status]
+        return self.status
+
+    def num_columns(self):
+        """ Returns the number of generated paths. """
+        return sum(len(p) for p in self.paths.values())
+
+    def _price(self, weights, sigma, tol):
+        """ Generates (demand, node list) for the shortest path of each demand under the
+            given link weights, only those with a reduced cost below -tol if demand duals
+            `sigma` are given. One shortest path tree is computed per source.
+        """
+        alg = ModifiedDijkstra(self.cg.reweighted(weights), self.cg.wt, engine="heap")
+        tree = None
+        for d in self.demand_list:  # Sorted, so demands with the same source are adjacent
+            if tree is None or tree.source != d[0]:
+                tree = alg.shortest_path_tree(d[0])
+            t = self.cg.index[d[1]]
+            ids = tree.getPathIds(t)
+            if ids is None:
+                continue
+            if sigma is not None and tree.getDistIds()[t] - sigma[d] >= -tol:
+                continue
+            yield d, self.cg.node_labels(ids)
+
+    def _build(self, penalty):
+        """ Builds the link-path problem without any paths, like
+            BasicLinkPathFormulation.py, with an unserved demand variable of cost
+            `penalty` per demand.
+        """
+        self.prob = LpProblem("Basic Link Path Formulation", LpMinimize)
+        self.obj = LpConstraintVar("obj")
+        self.prob.setObjective(self.obj)
+        self.cap_rows = []
+        for link in self.link_list:
+            row = LpConstraintVar("LinkCap|L{}_{}".format(link[0], link[1]), LpConstraintLE,
+                                  self.g[link[0]][link[1]][self.cap])
+            self.prob += row
+            self.cap_rows.append(row)
+        self.sat_rows = {}
+        self.unserved = []
+        for d in self.demand_list:
+            row = LpConstraintVar("DemandSat_{}_{}".format(d[0], d[1]), LpConstraintEQ,
+                                  self.demands[d])
+            self.prob += row
+            self.sat_rows[d] = row
+            self.unserved.append(LpVariable("uD{}_{}".format(d[0], d[1]), 0, None, LpContinuous,
+                                            penalty * self.obj + row))
+        self.paths = {}
+        self.demand_paths = {}
+        for d in self.demand_list:
+            self.paths[d] = []
+
+    def _add_path(self, d, node_list):
+        """ Adds a path of demand `d` as a new column of the problem. """
+        p = len(self.paths[d])
+        cost = 0.0
+        rows = set()
+        for i in range(len(node_list) - 1):
+            e = self.cg.edge_id(self.cg.index[node_list[i]], self.cg.index[node_list[i + 1]])
+            cost += self.cost[e]
+            rows.update(self.edge_rows[e])
+        column = cost * self.obj + self.sat_rows[d]
+        for i in rows:
+            column += self.cap_rows[i]
+        name = "xD{}_{}P_{}".format(d[0], d[1], str(p))
+        self.demand_paths[d, p] = LpVariable(name, 0, None, LpContinuous, column)
+        self.paths[d].append(node_list)
+
+
+if __name__ == "__main__":
+    import json
+    from networkx.readwrite import json_graph
+    from pulp import value
+    import Utilities.jsonconverter as jc
+
+    g = json_graph.node_link_graph(json.load(open("linkPathEx1.json")))
+    demands = jc.j_to_demands(json.load(open("demandLinkPathEx1.json")))
+    cgen = LinkPathColumnGeneration(g, demands)
+    status = cgen.solve()
+    print("Status: {}, objective {}, {} paths after {} iterations".format(
+        status, value(cgen.prob.objective), cgen.num_columns(), cgen.iterations))
+    for (d, p), var in sorted(cgen.demand_paths.items()):
+        if var.varValue > 0:
+            print(d, cgen.paths[d][p], var.varValue)
@@ -0,0 +1,122 @@
+""" A feasibility oracle for demand sweeps based on dominance.
+    Feasibility of the capacitated network design problem is monotone in the demand
+    volumes: if a demand vector d is feasible then so is every d' <= d (componentwise),
+    and if d is infeasible then so is every d' >= d. The oracle keeps the frontier of the
+    points solved so far, the maximal feasible and the minimal infeasible ones, and only
+    calls the solver for points that these don't decide.
+"""
+import numpy as np
+from Utilities.sweep import DemandSweep
+
+
+class DominanceIndex(object):
+    """ The known feasible and infeasible frontier points, as rows of NumPy arrays.
+
+        Parameters
+        ----------
+        n_demands : integer
+            the number of demands, i.e., the length of the points.
+    """
+    def __init__(self, n_demands):
+        self.feasible = np.empty((0, n_demands))  # Maximal known feasible points
+        self.infeasible = np.empty((0, n_demands))  # Minimal known infeasible points
+
+    def lookup(self, volumes):
+        """ Returns True if the point is known to be feasible, False if it is known to be
+            infeasible and None if it is undetermined.
+        """
+        v = np.asarray(volumes, dtype=float)
+        if len(self.feasible) > 0 and np.any(np.all(v <= self.feasible, axis=1)):
+            return True
+        if len(self.infeasible) > 0 and np.any(np.all(self.infeasible <= v, axis=1)):
+            return False
+        return None
+
+    def add(self, volumes, feasible):
+        """ Records a solved point, dropping the frontier points it dominates. """
+        v = np.asarray(volumes, dtype=float)
+        if feasible:
+            keep = ~np.all(self.feasible <= v, axis=1)
+            self.feasible = np.vstack([self.feasible[keep], v])
+        else:
+            keep = ~np.all(v <= self.infeasible, axis=1)
+            self.infeasible = np.vstack([self.infeasible[keep], v])
+
+
+class FeasibilityOracle(object):
+    """ Decides whether demand vectors are feasible, solving the node-link problem only for
+        points that the known frontier doesn't decide.
+
+        Parameters
+        ----------
+        g : networkx.DiGraph
+            a directed network graph.
+        demand_pairs : list
+            the demand (node) pairs, in the order of the point coordinates.
+        wt : string
+            (optional) the link weight attribute.
+        cap : string
+            (optional) the link capacity attribute.
+        aggregate : boolean
+            (optional) aggregate the demands by source, see
+            :func:`Utilities.sparse_lp.node_link_lp`. Doesn't change feasibility.
+
+        The counters `solves` and `avoided` tell how many points needed the solver and
+        how many were answered from the frontier.
+    """
+    def __init__(self, g, demand_pairs, wt="weight", cap="capacity", aggregate=False):
+        self.sweep = DemandSweep(g, demand_pairs, wt, cap, aggregate)
+        self.index = DominanceIndex(len(self.sweep.demand_pairs))
+        self.solves = 0
+        self.avoided = 0
+
+    def lookup(self, volumes):
+        """ Answers from the frontier only: True, False or None if undetermined. """
+        return self.index.lookup(volumes)
+
+    def is_feasible(self, volumes):
+        """ Returns True if the demand volumes can be routed, solving only if needed.
+            When the solver is called its solution is left in `sweep.lp`.
+        """
+        known = self.index.lookup(volumes)
+        if known is not None:
+            self.avoided += 1
+            return known
+        self.solves += 1
+        status = self.sweep.solve(volumes)
+        if status == "Optimal":
+            self.index.add(volumes, True)
+            return True
+        if status == "Infeasible":
+            self.index.add(volumes, False)
+        return False
+
+    def classify(self, points):
+        """ Generates (volumes, feasible) for each point in turn. """
+        for volumes in points:
+            yield volumes, self.is_feasible(volumes)
+
+    def reset(self):
+        """ Forgets the frontier and the solver state, but not the counters. """
+        self.index = DominanceIndex(len(self.sweep.demand_pairs))
+        self.sweep.lp.reset_solver()
+
+
+if __name__ == "__main__":
+    import time
+    import networkx as nx
+    from Utilities.sweep import grid_points
+
+    # The network and demand pairs of BasicNodeLinkFormulation.py
+    g_temp = nx.Graph()
+    g_temp.add_edge(1, 2, capacity=1, weight=1)
+    g_temp.add_edge(1, 3, capacity=1, weight=1)
+    g_temp.add_edge(2, 3, capacity=1, weight=1)
+    g = g_temp.to_directed()
+    pairs = [(1, 2), (1, 3), (2, 1), (2, 3), (3, 1), (3, 2)]
+    points = list(grid_points(np.arange(0.0, 2.0 + 0.4, 0.4), len(pairs)))
+    oracle = FeasibilityOracle(g, pairs)
+    tic = time.time()
+    feasible = sum(1 for volumes, ok in oracle.classify(points) if ok)
+    print("{} points, {} feasible in {:.2f} seconds: {} solves, {} avoided".format(
+        len(points), feasible, time.time() - tic, oracle.solves, oracle.avoided))
@@ -56,7 +56,7 @@ def getAllPathsInfo(demands, d_links, g, wt="weight"):
     path_list : list
         A list of path dictionaries with node-list, cost, and capacity information.
     """
-    print d_links
+    print(d_links)
     all_paths = []
     for d in demands.keys():
         d_paths = flowToPaths(d, d_links[d])
@@ -108,6 +108,70 @@ def flowToPaths(demand, gflow):
     return loads, path_node_list
 
 
+def disaggregateFlows(demands, source_flows):
+    """ Splits the flows of source aggregated commodities into flows per demand pair.
+        Each source's flow is realized by conformal paths from the source to its demand
+        destinations, as in flowToPaths, and every path is credited to the destination
+        it ends at.
+
+        Parameters
+        ----------
+        demands : dictionary
+            dictionary of original problem demands indexed by demand pair.
+        source_flows : dictionary
+            link flow values indexed by (link, source) pairs, e.g., the values of the
+            solution to a source aggregated node-link problem
+            (see :func:`Utilities.sparse_lp.node_link_lp`).
+
+        Returns
+        -------
+        demand_links : dictionary
+            a dictionary indexed by demand pair whose value is a list of (link, load)
+            tuples, in the format returned by getDemandLinks, for use with getAllPathsInfo.
+    """
+    volumes = {}
+    for d in demands.keys():
+        volumes.setdefault(d[0], {})
+        volumes[d[0]][d[1]] = volumes[d[0]].get(d[1], 0.0) + demands[d]
+    gflows = {}
+    for (link, source), load in source_flows.items():
+        if source in volumes and load > float_info.epsilon*sum(volumes[source].values()):
+            gflows.setdefault(source, []).append((link, load))
+    pair_loads = {}
+    special_node = "*S*"
+    for source, sinks in volumes.items():
+        # Close the flow with artificial links from each destination back to the source
+        flow = list(gflows.get(source, []))
+        total = 0.0
+        for sink, volume in sinks.items():
+            if volume > 0.0:
+                flow.append(((sink, special_node), volume))
+                total += volume
+        if total == 0.0:
+            continue
+        flow.append(((special_node, source), total))
+        while len(flow) > 0:
+            load, link_list, flow = _flowToPath((source, source), flow, append=False)
+            sink = None
+            for link in link_list:
+                if link[1] == special_node:
+                    sink = link[0]
+            # A cycle without the artificial node carries no demand, it is just removed
+            if sink is not None:
+                node_list = _linkListToNodeList((source, sink), link_list)
+                for i in range(len(node_list) - 1):
+                    key = (source, sink), (node_list[i], node_list[i + 1])
+                    pair_loads[key] = pair_loads.get(key, 0.0) + load
+            flow = _reduceFlowByLoad(load, link_list, flow)
+    demand_links = {}
+    for d in demands.keys():
+        demand_links[d] = []
+    for (d, link), load in sorted(pair_loads.items()):
+        if d in demand_links:
+            demand_links[d].append((link, load))
+    return demand_links
+
+
 def _reduceFlowByLoad(load, link_list, flow):
     """
     Reduces the flow by the load on the links in the list.
@@ -249,7 +313,8 @@ def getDemandLinks(demands, link_list, flow_vars, no_splitting=False):
         flow_vars : dictionary
             a dictionary of link, demand variables. In our case we are working with
             the solutions that have been returned from the solver. These are of type
-            PuLP LpVariables.
+            PuLP LpVariables, or plain flow values as from
+            :meth:`Utilities.approx_mcf.ApproxMCF.link_flows`.
 
         Returns
         -------
@@ -274,8 +339,11 @@ def getDemandLinks(demands, link_list, flow_vars, no_splitting=False):
         for e in link_list:
             if not no_splitting:
                 zero_test = float_info.epsilon*demands[d]
-            if flow_vars[e,d].value() > zero_test:
-                flow_list.append((e, flow_vars[e,d].value()))
+            value = flow_vars[e,d]
+            if hasattr(value, "value"):
+                value = value.value()
+            if value > zero_test:
+                flow_list.append((e, value))
         demand_links[d] = flow_list
 
     return demand_links
\ No newline at end of file
@@ -0,0 +1,306 @@
+""" Streaming LP and MPS file writers for :class:`Utilities.sparse_lp.SparseLP` problems,
+    and a matching MPS reader.
+    PuLP's writeLP and writeMPS need the whole problem as PuLP objects, which for
+    all-pairs node-link formulations takes far more memory and time than the sparse
+    arrays it comes from. The writers here go through the constraint matrix a row (LP)
+    or a column (MPS) at a time and write each as it is formatted, so apart from the
+    matrix itself only the variable names are held in memory. Names are formed by the
+    problem's naming functions and made legal the way PuLP does it, so the files match
+    the ones PuLP writes for the same problem up to number formatting and line breaks.
+
+    File names ending in ".gz" or ".bz2" are written and read compressed.
+"""
+import bz2
+import gzip
+import numpy as np
+import scipy.sparse as sp
+from pulp import LpElement
+from Utilities.sparse_lp import SparseLP
+
+_TERMS_PER_LINE = 8  # LP format readers limit the line length
+
+
+def open_file(filename, mode="r"):
+    """ Opens a text file for reading ("r") or writing ("w"), compressed with gzip or
+        bzip2 if the file name ends in ".gz" or ".bz2".
+    """
+    if filename.endswith(".gz"):
+        return gzip.open(filename, mode + "t")
+    if filename.endswith(".bz2"):
+        return bz2.open(filename, mode + "t")
+    return open(filename, mode)
+
+
+def _names(name_fn, keys):
+    return [name_fn(key).translate(LpElement.trans) for key in keys]
+
+
+def _num(a):
+    return repr(float(a))  # Shortest exact representation, so files read back exactly
+
+
+def _lp_expr(names, cols, vals):
+    """ Formats the terms of a linear expression the way PuLP does, wrapping long
+        expressions over several lines.
+    """
+    parts = []
+    for count, (j, a) in enumerate(zip(cols, vals)):
+        if count > 0 and count % _TERMS_PER_LINE == 0:
+            parts.append("\n")
+        if a == 1:
+            parts.append(" + " + names[j] if count > 0 else names[j])
+        elif a == -1:
+            parts.append(" - " + names[j] if count > 0 else "- " + names[j])
+        elif a < 0:
+            parts.append(" - {} {}".format(_num(-a), names[j]) if count > 0 else
+                         "{} {}".format(_num(a), names[j]))
+        else:
+            parts.append(" + {} {}".format(_num(a), names[j]) if count > 0 else
+                         "{} {}".format(_num(a), names[j]))
+    return "".join(parts)
+
+
+def write_lp(lp, filename):
+    """ Writes the problem in CPLEX LP format, the format of PuLP's writeLP.
+
+        Parameters
+        ----------
+        lp : SparseLP
+            the problem to write.
+        filename : string
+            the file name, compressed if it ends in ".gz" or ".bz2".
+    """
+    names = _names(lp.var_name, lp.var_keys)
+    with open_file(filename, "w") as f:
+        f.write("\\* {} *\\\n".format(lp.name))
+        f.write("Minimize\n")
+        obj_cols = np.flatnonzero(lp.c)
+        if len(obj_cols) == 0 and len(names) > 0:
+            f.write("OBJ: 0 {}\n".format(names[0]))
+        else:
+            f.write("OBJ: {}\n".format(_lp_expr(names, obj_cols, lp.c[obj_cols])))
+        f.write("Subject To\n")
+        for A, b, keys, name_fn, sense in [(lp.A_ub, lp.b_ub, lp.ub_keys, lp.ub_name, "<="),
+                                           (lp.A_eq, lp.b_eq, lp.eq_keys, lp.eq_name, "=")]:
+            if A is None:
+                continue
+            A = sp.csr_matrix(A)
+            indptr = A.indptr
+            for i in range(A.shape[0]):
+                row = slice(indptr[i], indptr[i + 1])
+                expr = _lp_expr(names, A.indices[row], A.data[row])
+                if expr == "":
+                    expr = "0 {}".format(names[0])  # An empty row still needs a term
+                row_name = name_fn(keys[i]).translate(LpElement.trans)
+                f.write("{}: {} {} {}\n".format(row_name, expr, sense, _num(b[i])))
+        f.write("End\n")
+
+
+def write_mps(lp, filename):
+    """ Writes the problem in free MPS format. Like the MPS files of PuLP the variables
+        have the default bounds, i.e., they are non-negative.
+
+        Parameters
+        ----------
+        lp : SparseLP
+            the problem to write.
+        filename : string
+            the file name, compressed if it ends in ".gz" or ".bz2".
+    """
+    names = _names(lp.var_name, lp.var_keys)
+    row_names = []
+    blocks = []
+    rhs = []
+    with open_file(filename, "w") as f:
+        f.write("*SENSE:Minimize\n")
+        f.write("NAME          {}\n".format(lp.name.translate(LpElement.trans)))
+        f.write("ROWS\n")
+        f.write(" N  OBJ\n")
+        for A, b, keys, name_fn, sense in [(lp.A_ub, lp.b_ub, lp.ub_keys, lp.ub_name, "L"),
+                                           (lp.A_eq, lp.b_eq, lp.eq_keys, lp.eq_name, "E")]:
+            if A is None:
+                continue
+            for i in range(A.shape[0]):
+                row_name = name_fn(keys[i]).translate(LpElement.trans)
+                row_names.append(row_name)
+                f.write(" {}  {}\n".format(sense, row_name))
+            blocks.append(A)
+            rhs.append(b)
+        f.write("COLUMNS\n")
+        if len(blocks) > 0:
+            A = sp.csc_matrix(sp.vstack(blocks))
+        else:
+            A = sp.csc_matrix((0, len(names)))
+        indptr = A.indptr
+        for j, name in enumerate(names):
+            lines = []
+            for k in range(indptr[j], indptr[j + 1]):
+                lines.append("    {}  {}  {}\n".format(name, row_names[A.indices[k]],
+                                                       _num(A.data[k])))
+            if lp.c[j] != 0 or len(lines) == 0:
+                lines.append("    {}  OBJ  {}\n".format(name, _num(lp.c[j])))
+            f.write("".join(lines))
+        f.write("RHS\n")
+        if len(rhs) > 0:
+            b = np.concatenate(rhs)
+            for i in np.flatnonzero(b):
+                f.write("    RHS  {}  {}\n".format(row_names[i], _num(b[i])))
+        f.write("BOUNDS\n")
+        f.write("ENDATA\n")
+
+
+def read_mps(filename):
+    """ Reads a linear program from a fixed or free MPS file whose names don't contain
+        spaces, e.g., one written by :func:`write_mps` or PuLP's writeMPS.
+
+        "G" rows are negated into "<=" rows. The variables must have the default bounds,
+        i.e., only "LO 0" and "PL" bounds are accepted, and RANGES are not supported
+        since :class:`SparseLP` can't hold them. A maximization problem (OBJSENSE MAX or
+        PuLP's "*SENSE:Maximize" comment) is read as the minimization of -c.
+
+        Parameters
+        ----------
+        filename : string
+            the file name, read compressed if it ends in ".gz" or ".bz2".
+
+        Returns
+        -------
+        lp : SparseLP
+            the problem, with the column and row names as variable and row keys.
+    """
+    name = "SparseLP"
+    obj_row = None
+    maximize = False
+    rows = {}  # Row name -> (type, index within its block)
+    ub_names = []
+    eq_names = []
+    ub_sign = []  # -1 for "G" rows
+    col_index = {}
+    col_names = []
+    c = []
+    ub_i, ub_j, ub_v = [], [], []
+    eq_i, eq_j, eq_v = [], [], []
+    b_ub = None
+    b_eq = None
+    section = None
+    with open_file(filename, "r") as f:
+        for line in f:
+            if line.startswith("*"):
+                if line.startswith("*SENSE:Maximize"):
+                    maximize = True
+                continue
+            fields = line.split()
+            if len(fields) == 0:
+                continue
+            if not line[0].isspace():
+                section = fields[0]
+                if section == "NAME":
+                    name = line[4:].strip() or name
+                elif section == "OBJSENSE" and len(fields) > 1:
+                    maximize = fields[1] in ("MAX", "MAXIMIZE")
+                elif section in ("RANGES",):
+                    raise ValueError("MPS RANGES are not supported")
+                elif section in ("RHS", "BOUNDS"):
+                    if b_ub is None:
+                        b_ub = np.zeros(len(ub_names))
+                        b_eq = np.zeros(len(eq_names))
+                elif section == "ENDATA":
+                    break
+                continue
+            if section == "OBJSENSE":
+                maximize = fields[0] in ("MAX", "MAXIMIZE")
+            elif section == "ROWS":
+                kind, row_name = fields[0], fields[1]
+                if kind == "N":
+                    if obj_row is None:
+                        obj_row = row_name
+                    rows[row_name] = ("N", 0)
+                elif kind == "E":
+                    rows[row_name] = ("E", len(eq_names))
+                    eq_names.append(row_name)
+                elif kind in ("L", "G"):
+                    rows[row_name] = ("L", len(ub_names))
+                    ub_names.append(row_name)
+                    ub_sign.append(1.0 if kind == "L" else -1.0)
+                else:
+                    raise ValueError("Unknown MPS row type {}".format(kind))
+            elif section == "COLUMNS":
+                if len(fields) >= 3 and fields[1] == "'MARKER'":
+                    continue  # Integer markers, the variables are read as continuous
+                col_name = fields[0]
+                j = col_index.get(col_name)
+                if j is None:
+                    j = len(col_names)
+                    col_index[col_name] = j
+                    col_names.append(col_name)
+                    c.append(0.0)
+                for k in range(1, len(fields) - 1, 2):
+                    kind, i = rows[fields[k]]
+                    a = float(fields[k + 1])
+                    if kind == "L":
+                        ub_i.append(i)
+                        ub_j.append(j)
+                        ub_v.append(a * ub_sign[i])
+                    elif kind == "E":
+                        eq_i.append(i)
+                        eq_j.append(j)
+                        eq_v.append(a)
+                    elif fields[k] == obj_row:
+                        c[j] = a
+            elif section == "RHS":
+                start = 1 if len(fields) % 2 == 1 else 0  # The RHS vector name is optional
+                for k in range(start, len(fields) - 1, 2):
+                    kind, i = rows[fields[k]]
+                    if kind == "L":
+                        b_ub[i] = float(fields[k + 1]) * ub_sign[i]
+                    elif kind == "E":
+                        b_eq[i] = float(fields[k + 1])
+            elif section == "BOUNDS":
+                kind = fields[0]
+                if kind == "PL" or (kind == "LO" and float(fields[-1]) == 0):
+                    continue
+                raise ValueError("MPS bound {} on {} is not supported".format(kind, fields[-2]))
+    if b_ub is None:
+        b_ub = np.zeros(len(ub_names))
+        b_eq = np.zeros(len(eq_names))
+    n = len(col_names)
+    c = np.array(c)
+    if maximize:
+        c = -c
+    A_ub = sp.csr_matrix((ub_v, (ub_i, ub_j)), shape=(len(ub_names), n)) if ub_names else None
+    A_eq = sp.csr_matrix((eq_v, (eq_i, eq_j)), shape=(len(eq_names), n)) if eq_names else None
+    identity = lambda key: key
+    return SparseLP(c, A_ub, b_ub if ub_names else None, A_eq, b_eq if eq_names else None,
+                    var_keys=col_names, ub_keys=ub_names, eq_keys=eq_names,
+                    var_name=identity, ub_name=identity, eq_name=identity, name=name)
+
+
+if __name__ == "__main__":
+    import os
+    import time
+    from BasicNodeLinkFormulationNSFtopology import create_nsf_topology
+    from Utilities.sparse_lp import node_link_lp
+
+    g = create_nsf_topology()
+    nodes = sorted(g.nodes())
+    demands = {}
+    for a in nodes:
+        for z in nodes:
+            if a != z:
+                demands[a, z] = 0.01
+    lp = node_link_lp(g, demands)
+    lp.solve()
+    print("{} variables, objective {}".format(lp.num_vars(), lp.objective))
+    for filename in ["nsfNodeLink.lpt", "nsfNodeLink.mps.gz"]:
+        tic = time.time()
+        if filename.endswith(".lpt"):
+            write_lp(lp, filename)
+        else:
+            write_mps(lp, filename)
+        print("Wrote {} ({} bytes) in {:.3f} seconds".format(filename, os.path.getsize(filename),
+                                                             time.time() - tic))
+    tic = time.time()
+    lp2 = read_mps("nsfNodeLink.mps.gz")
+    print("Read back in {:.3f} seconds".format(time.time() - tic))
+    lp2.solve()
+    print("Re-solved: {}, objective {}".format(lp2.status, lp2.objective))
@@ -0,0 +1,120 @@
+""" Parallel generation of candidate paths for large demand sets.
+    The demand pairs are split into chunks that are handed to a pool of worker processes
+    (or threads). Each worker receives a compiled, read-only copy of the graph once when
+    it starts and runs its own Yen k-shortest path instance over the chunks it gets.
+    See the example at the end of the file for a comparison with the serial version.
+"""
+import threading
+from multiprocessing import Pool, cpu_count
+from multiprocessing.pool import ThreadPool
+from Utilities.CompiledGraph import CompiledGraph
+from Utilities.YenKShortestPaths import YenKShortestPaths
+
+# Per worker state, set up once by _init_worker
+_worker = threading.local()
+
+
+def _init_worker(cg, num, max_stretch=None, max_cost=None):
+    """ Pool initializer, builds the worker's k-shortest path instance. """
+    _worker.alg = YenKShortestPaths(cg)
+    _worker.num = num
+    _worker.max_stretch = max_stretch
+    _worker.max_cost = max_cost
+
+
+def _cand_paths_chunk(pairs):
+    """ Computes the candidate paths for a chunk of demand pairs inside a worker. """
+    alg = _worker.alg
+    result = []
+    for d in pairs:
+        result.append([p.nodeList for p in alg.iter_k_shortest(d[0], d[1], _worker.num,
+                                                               _worker.max_cost,
+                                                               _worker.max_stretch)])
+    return result
+
+
+def gen_cand_paths_parallel(g, demands, num, processes=None, chunk_size=None, threads=False,
+                            wt="weight", cap="capacity", max_stretch=None, max_cost=None):
+    """ Generates demand path candidates using a pool of workers.
+        Gives the same result as :func:`Utilities.utilities.gen_cand_paths`.
+
+        Parameters
+        ----------
+        g : networkx.Graph
+            Graph representing the network.
+        demands : dictionary
+            A dictionary indexed by node pairs representing demands.
+        num : integer
+            The number of paths to be generated via a k-shortest path algorithm.
+        processes : integer
+            (optional) the number of workers, defaults to the number of CPUs.
+        chunk_size : integer
+            (optional) the number of demand pairs handed to a worker at a time. Defaults to
+            about four chunks per worker.
+        threads : boolean
+            (optional) use a pool of threads instead of processes.
+        wt : string
+            (optional) the link weight attribute.
+        cap : string
+            (optional) the link capacity attribute.
+        max_stretch, max_cost : float
+            (optional) cost bounds on the paths, see :func:`Utilities.utilities.gen_cand_paths`.
+
+        Returns
+        -------
+        paths : dictionary
+            A dictionary indexed by demand (node) pairs, whose value is a list of paths with
+            each path represented by a node list. The keys are in the order of `demands`.
+    """
+    if processes is None:
+        processes = cpu_count()
+    cg = CompiledGraph(g, wt, cap)
+    # Keep pairs with a common source together so the workers reuse their shortest path trees
+    pairs = sorted(demands.keys(), key=lambda d: cg.index[d[0]])
+    if chunk_size is None:
+        chunk_size = max(1, len(pairs) // (4 * processes))
+    chunks = [pairs[i:i + chunk_size] for i in range(0, len(pairs), chunk_size)]
+    pool_class = ThreadPool if threads else Pool
+    pool = pool_class(processes, initializer=_init_worker, initargs=(cg, num, max_stretch, max_cost))
+    try:
+        results = pool.map(_cand_paths_chunk, chunks)
+    finally:
+        pool.close()
+        pool.join()
+    found = {}
+    for chunk, chunk_paths in zip(chunks, results):
+        for d, d_paths in zip(chunk, chunk_paths):
+            found[d] = d_paths
+    paths = {}
+    for d in demands.keys():
+        paths[d] = found[d]
+    return paths
+
+
+if __name__ == "__main__":
+    import time
+    import random
+    import networkx as nx
+    from Utilities.utilities import gen_cand_paths
+
+    g = nx.random_geometric_graph(150, 0.15, seed=7)
+    for e in g.edges():
+        g[e[0]][e[1]]["weight"] = random.randint(1, 10)
+        g[e[0]][e[1]]["capacity"] = 10
+    nodes = list(g.nodes())
+    demands = {}
+    for a in nodes[0:40]:
+        for z in nodes[0:40]:
+            if a != z:
+                demands[a, z] = 1.0
+
+    tic = time.time()
+    serial = gen_cand_paths(g, demands, 5)
+    t_serial = time.time() - tic
+    print("Serial: {} demands in {:.2f} seconds".format(len(demands), t_serial))
+    for chunk_size in [None, 16, 128]:
+        tic = time.time()
+        parallel = gen_cand_paths_parallel(g, demands, 5, chunk_size=chunk_size)
+        t_par = time.time() - tic
+        print("Parallel, chunk size {}: {:.2f} seconds, speedup {:.2f}, same result: {}".format(
+            chunk_size, t_par, t_serial / t_par, parallel == serial))
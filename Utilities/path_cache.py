@@ -0,0 +1,251 @@
+""" A persistent, on-disk cache for candidate paths.
+    Generating candidate paths with a k-shortest path algorithm is usually the slowest
+    step before a link-path problem can be formulated, yet the topology and link weights
+    rarely change between planning runs. The cache stores the paths of each demand pair
+    together with a fingerprint of the topology and the link weights they were computed
+    with, and only recomputes the demand pairs that a weight change can affect.
+
+    The cache file is gzip compressed JSON so node identifiers need to be strings or numbers.
+"""
+import gzip
+import hashlib
+import json
+import os
+from Utilities.CompiledGraph import CompiledGraph
+from Utilities.ModifiedDijkstra import ModifiedDijkstra
+from Utilities.YenKShortestPaths import YenKShortestPaths
+import Utilities.jsonconverter as jc
+
+
+def topology_fingerprint(g):
+    """ Computes a stable hash of the nodes and links of a graph, ignoring link attributes.
+
+        Parameters
+        ----------
+        g : networkx.Graph
+            a directed or undirected graph
+
+        Returns
+        -------
+        fingerprint : string
+            a hex digest that only depends on the node and link sets.
+    """
+    if g.is_directed():
+        edges = sorted(repr(e) for e in g.edges())
+    else:
+        edges = sorted(repr(tuple(sorted(e, key=repr))) for e in g.edges())
+    nodes = sorted(repr(n) for n in g.nodes())
+    h = hashlib.sha1()
+    h.update(repr((g.is_directed(), nodes, edges)).encode("utf-8"))
+    return h.hexdigest()
+
+
+def _edge_keys(g, e):
+    """ The link orientations under which a path could use the link `e`. """
+    if g.is_directed():
+        return [(e[0], e[1])]
+    return [(e[0], e[1]), (e[1], e[0])]
+
+
+def stale_demands(g, paths, changed, num, wt="weight"):
+    """ Finds the demand pairs whose k-shortest paths may differ after some links changed.
+        A demand pair is stale if one of its paths uses a changed (or removed) link, or
+        if a path through a changed link could cost no more than the demand's k-th path,
+        before or after the change. The latter uses a lower bound on the cost of such a
+        path computed from shortest path trees on the changed graph `g`.
+
+        Parameters
+        ----------
+        g : networkx.Graph
+            the graph after the change.
+        paths : dictionary
+            candidate paths, indexed by demand pair, computed on the graph before the change.
+        changed : dictionary
+            indexed by the changed links with value the old link weight, or None if the
+            link didn't exist before. Removed links are those no longer in `g`.
+        num : integer
+            the number of paths that were requested per demand pair.
+        wt : string
+            (optional) the link weight attribute.
+
+        Returns
+        -------
+        stale : set
+            the demand pairs whose paths need to be recomputed.
+    """
+    changed_keys = set()
+    bound_links = []  # (link, lowest of its weights before and after the change)
+    added_links = []
+    for e, old in changed.items():
+        changed_keys.update(_edge_keys(g, e))
+        if not g.has_edge(e[0], e[1]):
+            w = old  # Removed link
+        elif old is None:
+            w = g[e[0]][e[1]][wt]
+            added_links.append((e, w))
+        else:
+            w = min(old, g[e[0]][e[1]][wt])
+        bound_links.append((e, w))
+    stale = set()
+    bounded = []  # Demands a path through a changed link could still affect
+    for d, d_paths in paths.items():
+        uses_change = False
+        for p in d_paths:
+            for i in range(len(p) - 1):
+                if (p[i], p[i + 1]) in changed_keys:
+                    uses_change = True
+                    break
+            if uses_change:
+                break
+        if uses_change:
+            stale.add(d)
+        elif len(d_paths) >= num or len(added_links) > 0:
+            bounded.append(d)
+        # With fewer than num paths all simple paths are known and only an added
+        # link can make a difference.
+    if len(bounded) == 0:
+        return stale
+    # Lower bound test: dist(s, u) + w(u, v) + dist(v, t) <= k-th path cost. Even a path
+    # through a changed link that ties with the k-th path can change the result. The
+    # distances on the changed graph never exceed those on the graph without the link.
+    from_alg = ModifiedDijkstra(g, wt, engine="heap")
+    if g.is_directed():
+        to_alg = ModifiedDijkstra(CompiledGraph(g, wt, reverse=True), wt, engine="heap")
+    else:
+        to_alg = from_alg
+    from_trees = {}
+    to_trees = {}
+    inf = float("inf")
+    for d in bounded:
+        if d[0] not in from_trees:
+            from_trees[d[0]] = from_alg.shortest_path_tree(d[0]).dist
+        if d[1] not in to_trees:
+            to_trees[d[1]] = to_alg.shortest_path_tree(d[1]).dist
+        if len(paths[d]) < num:
+            kth = inf  # Any new path would be added
+            links = added_links
+        else:
+            kth = 0.0
+            for p in paths[d]:
+                kth = max(kth, sum(g[p[i]][p[i + 1]][wt] for i in range(len(p) - 1)))
+            links = bound_links
+        dist_s = from_trees[d[0]]
+        dist_t = to_trees[d[1]]
+        for e, w in links:
+            for u, v in _edge_keys(g, e):
+                if dist_s.get(u, inf) + w + dist_t.get(v, inf) <= kth:
+                    stale.add(d)
+                    break
+            if d in stale:
+                break
+    return stale
+
+
+class CandidatePathCache(object):
+    """ Keeps candidate paths in a file between runs.
+
+        Entries are tied to a topology fingerprint, the link weight attribute and the
+        number of paths per demand. Changing link weights only invalidates the demand
+        pairs returned by :func:`stale_demands`; changing the topology invalidates all.
+
+        Parameters
+        ----------
+        filename : string
+            the cache file, created on first use.
+        wt : string
+            (optional) the link weight attribute used for the paths.
+    """
+    def __init__(self, filename, wt="weight"):
+        self.filename = filename
+        self.wt = wt
+        self.hits = 0    # Demand pairs served from the cache
+        self.misses = 0  # Demand pairs that had to be computed
+
+    def gen_cand_paths(self, g, demands, num):
+        """ Generates demand path candidates like :func:`Utilities.utilities.gen_cand_paths`,
+            computing only the demand pairs that are not validly cached.
+
+            Parameters
+            ----------
+            g : networkx.Graph
+                Graph representing the network.
+            demands : dictionary
+                A dictionary indexed by node pairs representing demands.
+            num : integer
+                The number of paths to be generated per demand pair.
+
+            Returns
+            -------
+            paths : dictionary
+                A dictionary indexed by demand (node) pairs, whose value is a list of paths
+                with each path represented by a node list.
+        """
+        fingerprint = topology_fingerprint(g)
+        cached = {}
+        dirty = True
+        entry = self._load()
+        if (entry is not None and entry["fingerprint"] == fingerprint and entry["wt"] == self.wt
+                and entry["k"] == num):
+            cached = jc.j_to_paths(entry["paths"])
+            changed = {}
+            for u, v, w in entry["weights"]:
+                if g[u][v][self.wt] != w:
+                    changed[u, v] = w
+            dirty = len(changed) > 0
+            if dirty:
+                for d in stale_demands(g, cached, changed, num, self.wt):
+                    del cached[d]
+        alg = None
+        paths = {}
+        for d in demands.keys():
+            if d in cached:
+                paths[d] = cached[d]
+                self.hits += 1
+                continue
+            if alg is None:
+                alg = YenKShortestPaths(g, self.wt, cap=None)
+            paths[d] = [p.nodeList for p in alg.iter_k_shortest(d[0], d[1], num)]
+            cached[d] = paths[d]
+            self.misses += 1
+            dirty = True
+        if dirty:
+            self._save(g, fingerprint, num, cached)
+        return paths
+
+    def _load(self):
+        """ Reads the cache file, returns None if there is none or it can't be read. """
+        if not os.path.exists(self.filename):
+            return None
+        try:
+            with gzip.open(self.filename, "rt") as f:
+                return json.load(f)
+        except (IOError, ValueError):
+            return None
+
+    def _save(self, g, fingerprint, num, paths):
+        """ Writes the paths and the link weights they were computed with. """
+        entry = {"fingerprint": fingerprint, "wt": self.wt, "k": num,
+                 "weights": [[e[0], e[1], g[e[0]][e[1]][self.wt]] for e in g.edges()],
+                 "paths": jc.paths_to_j(paths)}
+        tmp_name = self.filename + ".tmp"
+        with gzip.open(tmp_name, "wt") as f:
+            json.dump(entry, f, separators=(",", ":"))
+        os.replace(tmp_name, self.filename)
+
+
+if __name__ == "__main__":
+    import time
+    from networkx.readwrite import json_graph
+
+    g = json_graph.node_link_graph(json.load(open("linkPathEx1.json")))
+    demands = jc.j_to_demands(json.load(open("demandLinkPathEx1.json")))
+    cache = CandidatePathCache("pathsLinkPathEx1.cache.json.gz")
+    for run in range(2):
+        tic = time.time()
+        paths = cache.gen_cand_paths(g, demands, 3)
+        print("Run {}: {:.4f} seconds, hits {}, misses {}".format(run, time.time() - tic,
+                                                                  cache.hits, cache.misses))
+    e = list(g.edges())[0]
+    g[e[0]][e[1]]["weight"] += 10
+    paths = cache.gen_cand_paths(g, demands, 3)
+    print("After changing the weight of {}: hits {}, misses {}".format(e, cache.hits, cache.misses))
@@ -0,0 +1,230 @@
+""" Post-processing of design problem solutions with NumPy arrays.
+    The functions in :mod:`Utilities.utilities` that report on a solution read one PuLP
+    variable at a time and recompute path costs and capacities for every path. Here the
+    solution values are read into a single vector once, path costs and capacities are
+    computed once per candidate path set, and link loads, utilization and path reports
+    come from array operations. The results have the same structure as those of
+    link_util, paths_j, sol_paths_j and sol_net.
+"""
+import numpy as np
+import networkx as nx
+from Utilities.utilities import path_link_incidence
+
+
+def var_values(variables, keys=None):
+    """ Reads the values of PuLP variables into a vector.
+
+        Parameters
+        ----------
+        variables : dictionary
+            PuLP variables, e.g., the demand path variables of a link-path formulation.
+        keys : list
+            (optional) the keys to read, in order. All keys in dictionary order by default.
+
+        Returns
+        -------
+        x : numpy.ndarray
+            the values, NaN for variables without a value.
+    """
+    if keys is None:
+        keys = list(variables.keys())
+    values = [variables[key].varValue for key in keys]
+    try:
+        return np.array(values, dtype=float)
+    except TypeError:  # Some variables have no value
+        return np.array([np.nan if v is None else v for v in values], dtype=float)
+
+
+class LinkPathReport(object):
+    """ Reports on solutions of a link-path formulation over a fixed set of candidate
+        paths. The path-link incidence matrix and the path costs and capacities are
+        computed when the report is created and re-used for every solution.
+
+        Parameters
+        ----------
+        g : networkx.Graph
+            the network graph.
+        can_paths : dictionary
+            the candidate paths, indexed by demand pair, with each path a node list.
+        wt : string
+            (optional) the link weight attribute, for the path costs.
+        cap : string
+            (optional) the link capacity attribute.
+
+        The members `path_keys`, `path_cost` and `path_cap` give the (demand, path
+        number) pair, cost and capacity of each path, and `link_list` and `link_cap` the
+        links and their capacities.
+    """
+    def __init__(self, g, can_paths, wt="weight", cap="capacity"):
+        self.g = g
+        self.can_paths = can_paths
+        self.link_list = list(g.edges())
+        self.incidence, self.path_keys = path_link_incidence(self.link_list, can_paths,
+                                                             list(can_paths.keys()))
+        self.column = {}
+        for j, key in enumerate(self.path_keys):
+            self.column[key] = j
+        self.link_cap = np.array([g[e[0]][e[1]][cap] for e in self.link_list], dtype=float)
+        # Path cost and capacity over the hops of all paths in one go
+        index = {}
+        for i, e in enumerate(self.link_list):
+            index[e] = i
+            if not g.is_directed():
+                index[e[1], e[0]] = i
+        link_wt = np.array([g[e[0]][e[1]][wt] for e in self.link_list], dtype=float)
+        hops = []
+        n_hops = np.zeros(len(self.path_keys), dtype=np.int64)
+        for j, (d, p) in enumerate(self.path_keys):
+            node_list = can_paths[d][p]
+            for k in range(len(node_list) - 1):
+                i = index.get((node_list[k], node_list[k + 1]))
+                if i is None:
+                    raise Exception('Bad Path')
+                hops.append(i)
+            n_hops[j] = len(node_list) - 1
+        hops = np.array(hops, dtype=np.int64)
+        self.path_cost = np.zeros(len(self.path_keys))
+        self.path_cap = np.full(len(self.path_keys), np.inf)
+        has_hops = n_hops > 0
+        starts = (np.cumsum(n_hops) - n_hops)[has_hops]
+        if len(hops) > 0:
+            self.path_cost[has_hops] = np.add.reduceat(link_wt[hops], starts)
+            self.path_cap[has_hops] = np.minimum.reduceat(self.link_cap[hops], starts)
+
+    def values(self, d_paths):
+        """ Returns the values of the demand path variables indexed by (demand, path
+            number) as a vector in path order.
+        """
+        return var_values(d_paths, self.path_keys)
+
+    def link_loads(self, x):
+        """ Returns the link loads, in `link_list` order, for the path flows `x`. """
+        return self.incidence.dot(x)
+
+    def link_util(self, d_paths):
+        """ Returns the load of every link, like :func:`Utilities.utilities.link_util`. """
+        return dict(zip(self.link_list, self.link_loads(self.values(d_paths)).tolist()))
+
+    def utilization(self, d_paths):
+        """ Returns the load to capacity ratio of every link. """
+        loads = self.link_loads(self.values(d_paths))
+        with np.errstate(divide="ignore", invalid="ignore"):
+            ratio = loads / self.link_cap
+        return dict(zip(self.link_list, ratio.tolist()))
+
+    def paths_j(self):
+        """ Returns the candidate path information, like :func:`Utilities.utilities.paths_j`. """
+        info_paths = []
+        for (d, p), cost, cap in zip(self.path_keys, self.path_cost.tolist(),
+                                     self.path_cap.tolist()):
+            info_paths.append({"nodeList": self.can_paths[d][p], "cost": cost, "capacity": cap})
+        return info_paths
+
+    def sol_paths_j(self, d_paths, demands):
+        """ Returns the information about the solution paths carrying more than 0.1% of
+            their demand, like :func:`Utilities.utilities.sol_paths_j`, in the order of
+            the `d_paths` keys.
+        """
+        keys = list(d_paths.keys())
+        load = var_values(d_paths, keys)
+        volume = np.array([demands[key[0]] for key in keys], dtype=float)
+        cols = np.array([self.column[key] for key in keys], dtype=np.int64)
+        used = np.flatnonzero(load > 0.001 * volume)
+        ratio = (load[used] / volume[used]).tolist()
+        cost = self.path_cost[cols[used]].tolist()
+        used_load = load[used].tolist()
+        info_paths = []
+        for n, k in enumerate(used.tolist()):
+            d, p = keys[k]
+            info_paths.append({"nodeList": self.can_paths[d][p], "load": used_load[n],
+                               "cost": cost[n], "ratio": ratio[n]})
+        return info_paths
+
+
+def modular_capacities(link_list, link_cap, link_mod):
+    """ Computes the installed link capacities of a multi-modular dimensioning solution.
+
+        Parameters
+        ----------
+        link_list : list
+            the links.
+        link_cap : dictionary
+            the solution variables for the number of modules, indexed by (link, module
+            index).
+        link_mod : list
+            a list of tuples of (module capacity, module cost).
+
+        Returns
+        -------
+        capacities : numpy.ndarray
+            the capacity of each link in `link_list`.
+    """
+    keys = [(e, i) for e in link_list for i in range(len(link_mod))]
+    counts = var_values(link_cap, keys).reshape(len(link_list), len(link_mod))
+    return counts.dot(np.array([m[0] for m in link_mod], dtype=float))
+
+
+def sol_net(g, link_cap, link_mod, cap="capacity"):
+    """ Creates the solution network with only the dimensioned links, like
+        :func:`Utilities.utilities.sol_net`.
+
+        Parameters
+        ----------
+        g : networkx.Graph
+            the graph of the network describing the problem
+        link_cap : dictionary
+            a dictionary of solution variables for the modular link capacities
+        link_mod : list
+            a list of tuples of (module capacity, module cost)
+
+        Returns
+        -------
+        g_sol : networkx.Graph
+            the graph with only the dimensioned links installed.
+    """
+    link_list = list(g.edges())
+    capacities = modular_capacities(link_list, link_cap, link_mod)
+    g_sol = g.copy()
+    nx.set_edge_attributes(g_sol, dict(zip(link_list, capacities.tolist())), cap)
+    removed = np.flatnonzero(capacities < 0.5 * link_mod[0][0])  # Zero capacity links
+    g_sol.remove_edges_from([link_list[i] for i in removed])
+    return g_sol
+
+
+if __name__ == "__main__":
+    import random
+    import time
+    from pulp import LpVariable
+    from Utilities.utilities import gen_cand_paths, link_util, paths_j, sol_paths_j
+
+    g = nx.grid_2d_graph(12, 12)
+    for e in g.edges():
+        g[e[0]][e[1]]["weight"] = random.randint(1, 10)
+        g[e[0]][e[1]]["capacity"] = 100.0
+    nodes = list(g.nodes())
+    demands = {}
+    while len(demands) < 500:
+        a, z = random.sample(nodes, 2)
+        demands[a, z] = random.uniform(1.0, 10.0)
+    can_paths = gen_cand_paths(g, demands, 20)
+    d_paths = {}
+    for d in demands:
+        for p in range(len(can_paths[d])):
+            d_paths[d, p] = LpVariable("xD{}P{}".format(len(d_paths), p), 0)
+            d_paths[d, p].varValue = random.choice([0.0, random.uniform(0.0, demands[d])])
+    print("{} path variables".format(len(d_paths)))
+    tic = time.time()
+    report = LinkPathReport(g, can_paths)
+    print("Report setup {:.3f} seconds".format(time.time() - tic))
+    for name, old, new in [
+            ("link_util", lambda: link_util(g, d_paths, can_paths),
+             lambda: report.link_util(d_paths)),
+            ("paths_j", lambda: paths_j(can_paths, g), report.paths_j),
+            ("sol_paths_j", lambda: sol_paths_j(g, d_paths, can_paths, demands),
+             lambda: report.sol_paths_j(d_paths, demands))]:
+        tic = time.time()
+        old()
+        t_old = time.time() - tic
+        tic = time.time()
+        new()
+        print("{}: {:.4f} seconds before, {:.4f} seconds now".format(name, t_old, time.time() - tic))
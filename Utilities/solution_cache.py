@@ -0,0 +1,275 @@
+""" A content addressed cache of LP solutions.
+    Planning runs and demand sweeps solve the same problem instance many times. The
+    cache keys a solution on a hash of the problem data itself (objective, constraint
+    rows and right-hand sides) rather than on how the problem was built, so a repeated
+    instance, whether a PuLP problem from the formulation scripts or a
+    :class:`Utilities.sparse_lp.SparseLP`, gets its status, objective and variable values
+    back without calling the solver.
+
+    Solutions are kept in memory or, given a directory, in one compressed NumPy file per
+    problem so they are shared across runs and processes. The least recently used
+    solutions are evicted when the store grows past its size limit.
+"""
+import hashlib
+import os
+from collections import OrderedDict
+import numpy as np
+import scipy.sparse as sp
+
+
+def _hash_array(h, a, dtype):
+    a = np.ascontiguousarray(a, dtype=dtype)
+    h.update(str(a.shape).encode())
+    h.update(a.tobytes())
+
+
+def _hash_matrix(h, A):
+    if A is None:
+        h.update(b"None")
+        return
+    A = sp.csr_matrix(A, dtype=float, copy=True)
+    A.sum_duplicates()  # Also sorts the indices, giving a canonical form
+    A.eliminate_zeros()
+    _hash_array(h, A.shape, np.int64)
+    _hash_array(h, A.indptr, np.int64)
+    _hash_array(h, A.indices, np.int64)
+    _hash_array(h, A.data, float)
+
+
+def sparse_lp_key(lp):
+    """ Returns the hex digest identifying the data of a SparseLP. Two problems have the
+        same key when they have the same numbers in the same positions, whatever their
+        names.
+    """
+    h = hashlib.sha256(b"SparseLP")
+    _hash_array(h, lp.c, float)
+    for A, b in [(lp.A_ub, lp.b_ub), (lp.A_eq, lp.b_eq)]:
+        _hash_matrix(h, A)
+        if b is not None:
+            _hash_array(h, b, float)
+    return h.hexdigest()
+
+
+def pulp_key(prob):
+    """ Returns the hex digest identifying a PuLP problem by its sense, objective and
+        constraints. Variables are identified by name and the constraints are taken in
+        name order, so the order in which the problem was built doesn't matter.
+    """
+    h = hashlib.sha256(b"LpProblem")
+    h.update(repr(prob.sense).encode())
+    names = {}
+    variables = prob.variables()
+    for var in variables:
+        names[var.name] = len(names)
+        h.update("{} {!r} {!r} {}\n".format(var.name, var.lowBound, var.upBound,
+                                           var.cat).encode())
+
+    def hash_expr(expr):
+        terms = sorted((names[var.name], float(a)) for var, a in expr.items() if a != 0)
+        _hash_array(h, [j for j, a in terms], np.int64)
+        _hash_array(h, [a for j, a in terms], float)
+
+    if prob.objective is not None:
+        hash_expr(prob.objective)
+    for name in sorted(prob.constraints.keys()):
+        con = prob.constraints[name]
+        h.update("{} {} {!r}\n".format(name, con.sense, float(con.constant)).encode())
+        hash_expr(con)
+    return h.hexdigest()
+
+
+class SolutionCache(object):
+    """ Caches LP solutions by problem content.
+
+        Parameters
+        ----------
+        directory : string
+            (optional) the directory of the store, created if needed. By default the
+            solutions are only kept in memory.
+        max_bytes : integer
+            (optional) the size limit of the store, 256 MB by default.
+
+        The counters `hits` and `misses` count the solves answered from the cache and
+        those passed to the solver, see :meth:`stats`.
+    """
+    def __init__(self, directory=None, max_bytes=256 * 2**20):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self._memory = OrderedDict()  # key -> (status, objective, x), least recent first
+        self._memory_bytes = 0
+        if directory is not None and not os.path.isdir(directory):
+            os.makedirs(directory)
+
+    def solve(self, lp):
+        """ Solves a SparseLP unless its solution is cached, setting its status, x and
+            objective members either way.
+
+            Returns
+            -------
+            status : string
+                the PuLP status string, e.g., "Optimal" or "Infeasible".
+        """
+        key = sparse_lp_key(lp)
+        entry = self.get(key)
+        if entry is None:
+            lp.solve()
+            self.put(key, lp.status, lp.objective, lp.x)
+            return lp.status
+        lp.status, lp.objective, lp.x = entry
+        return lp.status
+
+    def solve_pulp(self, prob, solver=None):
+        """ Solves a PuLP problem unless its solution is cached, in which case the values
+            of its variables and its status are set from the cache.
+
+            Parameters
+            ----------
+            prob : pulp.LpProblem
+                the problem, e.g., from basic_capacitated_node_link or the link-path
+                formulation.
+            solver : pulp solver
+                (optional) the solver passed to LpProblem.solve.
+
+            Returns
+            -------
+            status : string
+                the PuLP status string, e.g., "Optimal" or "Infeasible".
+        """
+        from pulp import LpStatus, value
+        key = pulp_key(prob)
+        entry = self.get(key)
+        variables = prob.variables()
+        if entry is None:
+            prob.solve(solver)
+            status = LpStatus[prob.status]
+            x = np.array([var.varValue if var.varValue is not None else np.nan
+                          for var in variables])
+            self.put(key, status, value(prob.objective), x)
+            return status
+        status, objective, x = entry
+        for code, text in LpStatus.items():
+            if text == status:
+                prob.status = code
+        if x is not None:
+            for var, v in zip(variables, x):
+                var.varValue = None if np.isnan(v) else float(v)
+        return status
+
+    def get(self, key):
+        """ Returns the cached (status, objective, x) for a key, or None. """
+        entry = self._memory.get(key)
+        if entry is not None:
+            self._memory.move_to_end(key)
+        elif self.directory is not None:
+            filename = self._filename(key)
+            try:
+                with np.load(filename) as data:
+                    x = data["x"] if data["has_x"] else None
+                    objective = float(data["objective"]) if data["has_x"] else None
+                    entry = (str(data["status"]), objective, x)
+                os.utime(filename)  # Mark as recently used
+            except (IOError, OSError, KeyError, ValueError):
+                entry = None
+        if entry is None:
+            self.misses += 1
+        else:
+            self.hits += 1
+        return entry
+
+    def put(self, key, status, objective, x):
+        """ Stores a solution, evicting the least recently used ones if the store is full. """
+        if x is not None:
+            x = np.array(x, dtype=float)
+        if self.directory is None:
+            if key in self._memory:
+                self._memory_bytes -= _entry_bytes(self._memory.pop(key))
+            entry = (status, objective, x)
+            self._memory[key] = entry
+            self._memory_bytes += _entry_bytes(entry)
+            while self._memory_bytes > self.max_bytes and len(self._memory) > 1:
+                self._memory_bytes -= _entry_bytes(self._memory.popitem(last=False)[1])
+            return
+        filename = self._filename(key)
+        tmp_name = filename + ".{}.tmp".format(os.getpid())
+        with open(tmp_name, "wb") as f:
+            np.savez_compressed(f, status=np.array(status), has_x=np.array(x is not None),
+                                objective=np.array(objective if x is not None else 0.0),
+                                x=x if x is not None else np.zeros(0))
+        os.replace(tmp_name, filename)  # Atomic, so other processes never see a partial file
+        self._evict()
+
+    def stats(self):
+        """ Returns the hit and miss counts, the hit rate and the size of the store. """
+        total = self.hits + self.misses
+        if self.directory is None:
+            entries, size = len(self._memory), self._memory_bytes
+        else:
+            files = self._files()
+            entries, size = len(files), sum(s for t, s, name in files)
+        return {"hits": self.hits, "misses": self.misses,
+                "hit_rate": self.hits / float(total) if total > 0 else 0.0,
+                "entries": entries, "bytes": size}
+
+    def clear(self):
+        """ Removes all cached solutions, but not the counters. """
+        self._memory.clear()
+        self._memory_bytes = 0
+        if self.directory is not None:
+            for t, s, name in self._files():
+                os.remove(name)
+
+    def _filename(self, key):
+        return os.path.join(self.directory, key + ".npz")
+
+    def _files(self):
+        """ (access time, size, path) of the stored solutions. """
+        files = []
+        for entry in os.listdir(self.directory):
+            if entry.endswith(".npz"):
+                name = os.path.join(self.directory, entry)
+                try:
+                    st = os.stat(name)
+                except OSError:
+                    continue  # Evicted by another process
+                files.append((st.st_mtime, st.st_size, name))
+        return files
+
+    def _evict(self):
+        files = self._files()
+        size = sum(s for t, s, name in files)
+        files.sort()
+        while size > self.max_bytes and len(files) > 1:
+            t, s, name = files.pop(0)
+            try:
+                os.remove(name)
+            except OSError:
+                pass
+            size -= s
+
+
+def _entry_bytes(entry):
+    x = entry[2]
+    return 100 + (x.nbytes if x is not None else 0)
+
+
+if __name__ == "__main__":
+    import time
+    from BasicNodeLinkFormulationNSFtopology import create_nsf_topology
+    from Utilities.sparse_lp import node_link_lp
+
+    g = create_nsf_topology()
+    nodes = sorted(g.nodes())
+    cache = SolutionCache()
+    tic = time.time()
+    for volume in [0.01, 0.02, 0.01, 0.03, 0.02, 0.01]:  # A sweep with repeated points
+        demands = {}
+        for a in nodes:
+            for z in nodes:
+                if a != z:
+                    demands[a, z] = volume
+        lp = node_link_lp(g, demands, aggregate=True)
+        status = cache.solve(lp)
+        print("Volume {}: {}, objective {}".format(volume, status, lp.objective))
+    print("{:.3f} seconds, {}".format(time.time() - tic, cache.stats()))
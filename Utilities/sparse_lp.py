@@ -0,0 +1,717 @@
+""" Linear programs held as NumPy/SciPy sparse arrays, and a builder for the node-link
+    formulation of the capacitated network design problem.
+    Building a PuLP problem creates a Python object with a formatted name for every
+    variable and assembles each constraint from Python lists, which for all-pairs
+    demands takes longer than solving. Here the objective and the constraint rows come
+    straight from the node-arc incidence matrix of the network (a Kronecker product
+    across demands) and are handed to the HiGHS solver in SciPy as they are. Names and
+    PuLP objects are only created on request, see :meth:`SparseLP.to_pulp`.
+
+    If the highspy package is installed the problem is kept in a HiGHS instance, so that
+    after changing right-hand sides a re-solve starts from the previous basis.
+"""
+import numpy as np
+import scipy.sparse as sp
+from scipy.optimize import linprog
+from Utilities.utilities import path_link_incidence
+try:
+    import highspy
+except ImportError:
+    highspy = None
+
+# PuLP status strings for the scipy.optimize.linprog status codes
+_STATUS = {0: "Optimal", 1: "Not Solved", 2: "Infeasible", 3: "Unbounded", 4: "Not Solved"}
+
+
+class ProductKeys(object):
+    """ A read-only sequence of the pairs (a, b) for a in `first` and b in `second`, in
+        that (row major) order, without storing the pairs.
+    """
+    def __init__(self, first, second):
+        self.first = first
+        self.second = second
+
+    def __len__(self):
+        return len(self.first) * len(self.second)
+
+    def __getitem__(self, i):
+        if i < 0:
+            i += len(self)
+        if i < 0 or i >= len(self):
+            raise IndexError("ProductKeys index out of range")
+        n = len(self.second)
+        return self.first[i // n], self.second[i % n]
+
+    def index(self, key):
+        """ Position of the pair `key`. """
+        return self.first.index(key[0]) * len(self.second) + self.second.index(key[1])
+
+
+class SparseLP(object):
+    """ The linear program: minimize c x subject to A_ub x <= b_ub, A_eq x == b_eq and
+        x >= 0, with the constraint matrices as SciPy sparse arrays.
+
+        Variables and rows are identified by keys, e.g., (link, demand) pairs, and given
+        names by naming functions of their keys. Both are only used when the solution
+        is read by key or a PuLP view is created.
+
+        Parameters
+        ----------
+        c : numpy.ndarray
+            the objective coefficients.
+        A_ub, b_ub : scipy.sparse matrix and numpy.ndarray
+            the inequality constraints, None if there are none.
+        A_eq, b_eq : scipy.sparse matrix and numpy.ndarray
+            the equality constraints, None if there are none.
+        var_keys, ub_keys, eq_keys : sequence
+            (optional) keys of the variables, inequality rows and equality rows.
+        var_name, ub_name, eq_name : function
+            (optional) functions that return the name of a variable or row given its key.
+        name : string
+            (optional) the problem name.
+
+        After :meth:`solve` the members `status` (a PuLP status string), `x` (the
+        variable values) and `objective` hold the result.
+    """
+    def __init__(self, c, A_ub=None, b_ub=None, A_eq=None, b_eq=None, var_keys=None,
+                 ub_keys=None, eq_keys=None, var_name=None, ub_name=None, eq_name=None,
+                 name="SparseLP"):
+        self.c = np.asarray(c, dtype=float)
+        self.A_ub = A_ub
+        self.b_ub = None if b_ub is None else np.asarray(b_ub, dtype=float)
+        self.A_eq = A_eq
+        self.b_eq = None if b_eq is None else np.asarray(b_eq, dtype=float)
+        n = len(self.c)
+        self.var_keys = var_keys if var_keys is not None else range(n)
+        self.ub_keys = ub_keys if ub_keys is not None else range(_rows(A_ub))
+        self.eq_keys = eq_keys if eq_keys is not None else range(_rows(A_eq))
+        self.var_name = var_name if var_name is not None else lambda key: "x{}".format(key)
+        self.ub_name = ub_name if ub_name is not None else lambda key: "ub{}".format(key)
+        self.eq_name = eq_name if eq_name is not None else lambda key: "eq{}".format(key)
+        self.name = name
+        self.status = "Not Solved"
+        self.x = None
+        self.objective = None
+        self._highs = None  # highspy.Highs instance holding the model and the last basis
+        self._eq_offset = 0  # Position of the first equality row in the HiGHS model
+        self._lazy = None  # The problem with the active inequality rows, kept by solve_lazy
+        self.active_ub = None  # Inequality rows used by solve_lazy
+
+    def num_vars(self):
+        return len(self.c)
+
+    def update_b_eq(self, rows, values):
+        """ Changes the right-hand sides of some equality rows. The next solve re-uses the
+            basis of the previous one when highspy is available.
+
+            Parameters
+            ----------
+            rows : numpy.ndarray
+                indices of the equality rows to change.
+            values : numpy.ndarray
+                their new right-hand sides.
+        """
+        rows = np.asarray(rows, dtype=np.int64)
+        values = np.asarray(values, dtype=float)
+        self.b_eq[rows] = values
+        if self._highs is not None and len(rows) > 0:
+            hrows = (rows + self._eq_offset).astype(np.int32)
+            self._highs.changeRowsBounds(len(hrows), hrows, values, values)
+        if self._lazy is not None:
+            self._lazy.update_b_eq(rows, values)
+
+    def add_ub_rows(self, A, b, keys=None):
+        """ Appends inequality rows. The next solve re-uses the basis of the previous one
+            when highspy is available.
+
+            Parameters
+            ----------
+            A : scipy.sparse matrix
+                the new rows.
+            b : numpy.ndarray
+                their right-hand sides.
+            keys : sequence
+                (optional) the keys of the new rows. Needed unless the rows have the
+                default keys, i.e., their positions.
+        """
+        A = sp.csr_matrix(A)
+        b = np.asarray(b, dtype=float)
+        n_old = _rows(self.A_ub)
+        if self.A_ub is None:
+            self.A_ub = A
+            self.b_ub = b
+        else:
+            self.A_ub = sp.vstack([self.A_ub, A], format="csr")
+            self.b_ub = np.concatenate([self.b_ub, b])
+        if keys is not None:
+            self.ub_keys = list(self.ub_keys) + list(keys)
+        elif isinstance(self.ub_keys, range):
+            self.ub_keys = range(n_old + A.shape[0])
+        if self._highs is not None and A.shape[0] > 0:
+            # HiGHS puts them after the equality rows
+            self._highs.addRows(A.shape[0], np.full(A.shape[0], -highspy.kHighsInf), b, A.nnz,
+                                A.indptr[0:-1].astype(np.int32), A.indices.astype(np.int32),
+                                A.data.astype(float))
+
+    def reset_solver(self):
+        """ Drops the solver state kept between solves, so the next solve starts cold. """
+        self._highs = None
+        self._lazy = None
+        self.active_ub = None
+
+    def solve(self):
+        """ Solves the problem with the HiGHS solver, through highspy if it is installed
+            and otherwise through scipy.optimize.linprog.
+
+            Returns
+            -------
+            status : string
+                the PuLP status string, e.g., "Optimal" or "Infeasible".
+        """
+        if len(self.c) == 0:
+            return self._solveEmpty()
+        if highspy is not None:
+            return self._solveHighs()
+        res = linprog(self.c, A_ub=self.A_ub, b_ub=self.b_ub, A_eq=self.A_eq, b_eq=self.b_eq,
+                      bounds=(0, None), method="highs")
+        self.status = _STATUS.get(res.status, "Undefined")
+        if res.status == 0:
+            self.x = res.x
+            self.objective = res.fun
+        else:
+            self.x = None
+            self.objective = None
+        return self.status
+
+    def _solveEmpty(self):
+        """ Solves a problem without variables, e.g., a presolved one without traffic. It
+            is feasible, with objective 0, if every row holds for x = 0.
+        """
+        feasible = ((self.b_eq is None or np.all(self.b_eq == 0)) and
+                    (self.b_ub is None or np.all(self.b_ub >= 0)))
+        self.status = "Optimal" if feasible else "Infeasible"
+        self.x = np.zeros(0) if feasible else None
+        self.objective = 0.0 if feasible else None
+        return self.status
+
+    def _solveHighs(self):
+        """ Solves with highspy, creating the HiGHS model on first use. """
+        h = self._highs
+        if h is None:
+            h = highspy.Highs()
+            h.setOptionValue("output_flag", False)
+            inf = highspy.kHighsInf
+            blocks = [A for A in (self.A_ub, self.A_eq) if A is not None]
+            n = len(self.c)
+            if len(blocks) > 0:
+                A = sp.csc_matrix(sp.vstack(blocks))
+            else:
+                A = sp.csc_matrix((0, n))
+            lower = []
+            upper = []
+            if self.A_ub is not None:
+                lower.append(np.full(len(self.b_ub), -inf))
+                upper.append(self.b_ub)
+            if self.A_eq is not None:
+                lower.append(self.b_eq)
+                upper.append(self.b_eq)
+            model = highspy.HighsLp()
+            model.num_col_ = n
+            model.num_row_ = A.shape[0]
+            model.col_cost_ = self.c
+            model.col_lower_ = np.zeros(n)
+            model.col_upper_ = np.full(n, inf)
+            model.row_lower_ = np.concatenate(lower) if lower else np.zeros(0)
+            model.row_upper_ = np.concatenate(upper) if upper else np.zeros(0)
+            model.a_matrix_.format_ = highspy.MatrixFormat.kColwise
+            model.a_matrix_.start_ = A.indptr
+            model.a_matrix_.index_ = A.indices
+            model.a_matrix_.value_ = A.data
+            h.passModel(model)
+            self._highs = h
+            self._eq_offset = _rows(self.A_ub)
+        h.run()
+        model_status = h.getModelStatus()
+        if model_status == highspy.HighsModelStatus.kModelEmpty:
+            return self._solveEmpty()
+        if model_status == highspy.HighsModelStatus.kOptimal:
+            self.status = "Optimal"
+            self.x = np.array(h.getSolution().col_value)
+            self.objective = h.getInfo().objective_function_value
+        else:
+            if model_status == highspy.HighsModelStatus.kInfeasible:
+                self.status = "Infeasible"
+            elif model_status == highspy.HighsModelStatus.kUnbounded:
+                self.status = "Unbounded"
+            else:
+                self.status = "Undefined"
+            self.x = None
+            self.objective = None
+        return self.status
+
+    def solve_lazy(self, tol=1e-9, max_rounds=1000):
+        """ Solves the problem by row generation: first without the inequality rows, then
+            adding just the ones the solution violates and solving again until it
+            violates none. For problems where few inequalities bind, e.g., the capacity
+            rows of a lightly loaded network, the problems solved stay much smaller than
+            the full one. Sets the same members as :meth:`solve`, and `active_ub` to the
+            indices of the inequality rows that were added, in that order.
+
+            The problem with the added rows is kept, so after :meth:`update_b_eq` the
+            next call starts from its rows and, with highspy, its basis. If the problem
+            without the remaining rows is unbounded, which doesn't make the full problem
+            unbounded, the full problem is solved instead.
+
+            Parameters
+            ----------
+            tol : float
+                (optional) the relative violation above which a row is added.
+            max_rounds : integer
+                (optional) the maximum number of solves.
+
+            Returns
+            -------
+            status : string
+                the PuLP status string, e.g., "Optimal" or "Infeasible".
+        """
+        if self.A_ub is None:
+            self.active_ub = np.zeros(0, dtype=np.int64)
+            return self.solve()
+        A_ub = sp.csr_matrix(self.A_ub)
+        sub = self._lazy
+        if sub is None:
+            b_eq = None if self.b_eq is None else self.b_eq.copy()
+            sub = SparseLP(self.c, None, None, self.A_eq, b_eq, name=self.name)
+            self._lazy = sub
+            self.active_ub = np.zeros(0, dtype=np.int64)
+        active = self.active_ub
+        rounds = 0
+        while rounds < max_rounds:
+            rounds += 1
+            status = sub.solve()
+            if status == "Infeasible":
+                break  # Infeasible without the rows is so with them too
+            if status != "Optimal":
+                self._lazy = None
+                self.active_ub = np.arange(A_ub.shape[0])
+                return self.solve()
+            excess = A_ub.dot(sub.x) - self.b_ub
+            violated = np.flatnonzero(excess > tol * (1.0 + np.abs(self.b_ub)))
+            violated = np.setdiff1d(violated, active)  # Active rows only violated by round off
+            if len(violated) == 0:
+                break
+            sub.add_ub_rows(A_ub[violated], self.b_ub[violated])
+            active = np.concatenate([active, violated])
+            self.active_ub = active
+        else:
+            status = "Not Solved"  # Ran out of rounds with rows still violated
+        self.status = status
+        self.x = sub.x if status == "Optimal" else None
+        self.objective = sub.objective if status == "Optimal" else None
+        return self.status
+
+    def pulp_order(self):
+        """ Returns the variable indices in the order PuLP's LpProblem.variables() would
+            list the variables of the equivalent problem, i.e., sorted by name.
+        """
+        from pulp import LpElement
+        names = [self.var_name(key).translate(LpElement.trans) for key in self.var_keys]
+        return sorted(range(len(names)), key=names.__getitem__)
+
+    def values(self):
+        """ Returns the solution as a dictionary from variable key to value. """
+        return dict(zip(self.var_keys, self.x))
+
+    def to_pulp(self):
+        """ Creates the equivalent PuLP problem, for writing LP files or trying other
+            solvers on small problems. Variable and constraint names come from the naming
+            functions so they match those of a problem built directly with PuLP.
+
+            Returns
+            -------
+            prob, variables : pulp.LpProblem, dictionary
+                the problem and its variables indexed by variable key.
+        """
+        from pulp import LpProblem, LpMinimize, LpVariable, LpAffineExpression
+        prob = LpProblem(self.name, LpMinimize)
+        var_list = [LpVariable(self.var_name(key), 0) for key in self.var_keys]
+        prob += LpAffineExpression([(var_list[j], self.c[j]) for j in np.flatnonzero(self.c)])
+        for A, b, keys, name, sense in [(self.A_ub, self.b_ub, self.ub_keys, self.ub_name, "<="),
+                                        (self.A_eq, self.b_eq, self.eq_keys, self.eq_name, "==")]:
+            if A is None:
+                continue
+            A = sp.csr_matrix(A)
+            for i in range(A.shape[0]):
+                row = slice(A.indptr[i], A.indptr[i + 1])
+                expr = LpAffineExpression([(var_list[j], a) for j, a in
+                                           zip(A.indices[row], A.data[row])])
+                if sense == "<=":
+                    prob += expr <= b[i], name(keys[i])
+                else:
+                    prob += expr == b[i], name(keys[i])
+        return prob, dict(zip(self.var_keys, var_list))
+
+
+def _rows(A):
+    return 0 if A is None else A.shape[0]
+
+
+def incidence_matrix(node_list, link_list):
+    """ The node-arc incidence matrix of the directed links `link_list` over the nodes
+        `node_list`: +1 where a link leaves a node and -1 where it enters it.
+
+        Returns
+        -------
+        N : scipy.sparse.csr_matrix
+            a len(node_list) by len(link_list) matrix.
+    """
+    index = {}
+    for i, node in enumerate(node_list):
+        index[node] = i
+    n_links = len(link_list)
+    tails = np.fromiter((index[l[0]] for l in link_list), dtype=np.int64, count=n_links)
+    heads = np.fromiter((index[l[1]] for l in link_list), dtype=np.int64, count=n_links)
+    cols = np.arange(n_links)
+    data = np.concatenate([np.ones(n_links), -np.ones(n_links)])
+    return sp.csr_matrix((data, (np.concatenate([tails, heads]), np.concatenate([cols, cols]))),
+                         shape=(len(node_list), n_links))
+
+
+def demand_rhs(node_list, com_list, demand_list, aggregate=False):
+    """ The matrix B mapping demand volumes to the right-hand sides of the flow
+        conservation rows of :func:`node_link_lp`, i.e., b_eq = B v where v holds the
+        volumes of `demand_list`. Each demand puts its volume on the row of its source
+        and takes it off the row of its sink.
+
+        Returns
+        -------
+        B : scipy.sparse.csr_matrix
+            a len(node_list) * len(com_list) by len(demand_list) matrix.
+    """
+    n_com = len(com_list)
+    node_index = {}
+    for i, node in enumerate(node_list):
+        node_index[node] = i
+    com_index = {}
+    for j, k in enumerate(com_list):
+        com_index[k] = j
+    rows = []
+    cols = []
+    data = []
+    for i, d in enumerate(demand_list):
+        j = com_index[d[0]] if aggregate else com_index[d]
+        rows.extend([node_index[d[0]] * n_com + j, node_index[d[1]] * n_com + j])
+        cols.extend([i, i])
+        data.extend([1.0, -1.0])
+    return sp.csr_matrix((data, (rows, cols)), shape=(len(node_list) * n_com, len(demand_list)))
+
+
+def node_link_lp(g, demands, wt="weight", cap="capacity", aggregate=False):
+    """ Builds the basic capacitated network design problem in node-link formulation, the
+        same problem as `basic_capacitated_node_link` in BasicNodeLinkFormulation.py, as
+        a :class:`SparseLP`.
+
+        With the sorted links L, nodes V and commodities K the variables are the link
+        flows x[l, k], numbered link major (l * |K| + k). Then the objective is kron(w, 1_K),
+        the capacity rows kron(I_L, 1_K^T) and the flow conservation rows, one per node and
+        commodity, kron(N, I_K) where N is the node-arc incidence matrix.
+
+        By default there is a commodity per demand pair. With `aggregate` the demands are
+        aggregated by source node into one commodity per source, which has the same
+        optimal cost with about N times fewer variables for full-mesh traffic on N
+        nodes. Use :func:`Utilities.flow_paths.disaggregateFlows` to recover per demand
+        pair flows from the solution.
+
+        Parameters
+        ----------
+        g : networkx.DiGraph
+            a directed network graph g,
+        demands : dictionary
+            a dictionary of demands indexed by node pairs
+        wt : string
+            (optional) the link weight attribute.
+        cap : string
+            (optional) the link capacity attribute.
+        aggregate : boolean
+            (optional) aggregate the demands by source node.
+
+        Returns
+        -------
+        lp : SparseLP
+            the problem, with variables keyed by (link, demand), capacity rows keyed by
+            link and conservation rows keyed by (node, demand). Names follow the PuLP
+            version of the problem. When aggregated the source node replaces the demand
+            in the keys and the names, e.g., "S{source}_xL{nodeA}_{nodeZ}".
+    """
+    demand_list = sorted(demands.keys())
+    if aggregate:
+        com_list = sorted(set(d[0] for d in demand_list))
+    else:
+        com_list = demand_list
+    link_list = sorted(g.edges())
+    node_list = sorted(g.nodes())
+    n_com = len(com_list)
+    weights = np.array([g[l[0]][l[1]][wt] for l in link_list], dtype=float)
+    caps = np.array([g[l[0]][l[1]][cap] for l in link_list], dtype=float)
+    c = np.repeat(weights, n_com)
+    A_ub = sp.kron(sp.identity(len(link_list), format="csr"), np.ones((1, n_com)), format="csr")
+    N = incidence_matrix(node_list, link_list)
+    A_eq = sp.kron(N, sp.identity(n_com, format="csr"), format="csr")
+    B = demand_rhs(node_list, com_list, demand_list, aggregate)
+    b_eq = B.dot(np.array([demands[d] for d in demand_list], dtype=float))
+    if aggregate:
+        var_name = lambda k: "S{}_xL{}_{}".format(k[1], k[0][0], k[0][1])
+        eq_name = lambda k: "NodeCons|{}S{}".format(k[0], k[1])
+    else:
+        var_name = lambda k: "D{}_{}_xL{}_{}".format(k[1][0], k[1][1], k[0][0], k[0][1])
+        eq_name = lambda k: "NodeCons|{}D{}_{}".format(k[0], k[1][0], k[1][1])
+    return SparseLP(c, A_ub, caps, A_eq, b_eq,
+                    var_keys=ProductKeys(link_list, com_list),
+                    ub_keys=link_list,
+                    eq_keys=ProductKeys(node_list, com_list),
+                    var_name=var_name,
+                    ub_name=lambda l: "LinkCap|L{}_{}".format(l[0], l[1]),
+                    eq_name=eq_name,
+                    name="Basic Node Link Formulation")
+
+def presolve_node_link_lp(g, demands, wt="weight", cap="capacity", tol=0.0):
+    """ Builds the node-link problem of :func:`node_link_lp`, per demand pair, after a
+        presolve that leaves out what can't matter:
+
+        * demands with a volume of at most `tol`,
+        * for each demand, the links that aren't on any path from its source to its
+          destination, i.e., whose tail can't be reached from the source or whose head
+          can't reach the destination, and the conservation rows of nodes without any
+          of the remaining links,
+        * the conservation row of each demand's destination, which is implied by the
+          other rows of the demand,
+        * capacity rows without any flow variable.
+
+        The problem then grows with the real traffic rather than with the declared
+        demand set. A demand whose destination can't be reached keeps its source row
+        without variables, so the problem is infeasible as it should be.
+
+        Parameters
+        ----------
+        g : networkx.DiGraph
+            a directed network graph g,
+        demands : dictionary
+            a dictionary of demands indexed by node pairs
+        wt : string
+            (optional) the link weight attribute.
+        cap : string
+            (optional) the link capacity attribute.
+        tol : float
+            (optional) demands with volumes up to this are dropped.
+
+        Returns
+        -------
+        lp : SparseLP
+            the reduced problem. Variables, rows and names are those of the kept
+            variables and rows of :func:`node_link_lp`, so its solution is indexed by the
+            original (link, demand) keys, see :func:`expand_values`.
+    """
+    demand_list = [d for d in sorted(demands.keys()) if demands[d] > tol and d[0] != d[1]]
+    link_list = sorted(g.edges())
+    node_list = sorted(g.nodes())
+    node_index = {}
+    for i, node in enumerate(node_list):
+        node_index[node] = i
+    tails = np.array([node_index[l[0]] for l in link_list], dtype=np.int64)
+    heads = np.array([node_index[l[1]] for l in link_list], dtype=np.int64)
+    weights = np.array([g[l[0]][l[1]][wt] for l in link_list], dtype=float)
+    caps = np.array([g[l[0]][l[1]][cap] for l in link_list], dtype=float)
+    n_nodes = len(node_list)
+    # Reachability from each source and to each destination, shared among demands
+    from_source = {}
+    to_sink = {}
+    rg = g.reverse(copy=False)
+    for d in demand_list:
+        if d[0] not in from_source:
+            from_source[d[0]] = _reachable(g, d[0], node_index, n_nodes)
+        if d[1] not in to_sink:
+            to_sink[d[1]] = _reachable(rg, d[1], node_index, n_nodes)
+    var_links = []
+    var_coms = []
+    eq_keys = []
+    eq_rows = []
+    eq_cols = []
+    eq_data = []
+    b_eq = []
+    n_vars = 0
+    for k, d in enumerate(demand_list):
+        s = node_index[d[0]]
+        t = node_index[d[1]]
+        links = np.flatnonzero(from_source[d[0]][tails] & to_sink[d[1]][heads])
+        nodes = np.union1d(tails[links], heads[links])
+        nodes = nodes[nodes != t]
+        if len(nodes) == 0:
+            nodes = np.array([s])  # No path, keep the source row to make this infeasible
+        row = {}
+        for v in nodes:
+            row[v] = len(eq_keys)
+            eq_keys.append((node_list[v], d))
+            b_eq.append(demands[d] if v == s else 0.0)
+        cols = np.arange(n_vars, n_vars + len(links))
+        for ends, sign in [(tails[links], 1.0), (heads[links], -1.0)]:
+            keep = ends != t
+            eq_rows.extend(row[v] for v in ends[keep])
+            eq_cols.extend(cols[keep])
+            eq_data.extend([sign] * int(keep.sum()))
+        var_links.append(links)
+        var_coms.append(np.full(len(links), k, dtype=np.int64))
+        n_vars += len(links)
+    var_links = np.concatenate(var_links) if var_links else np.zeros(0, dtype=np.int64)
+    var_coms = np.concatenate(var_coms) if var_coms else np.zeros(0, dtype=np.int64)
+    used_links = np.unique(var_links)
+    ub_row = np.full(len(link_list), -1, dtype=np.int64)
+    ub_row[used_links] = np.arange(len(used_links))
+    A_ub = sp.csr_matrix((np.ones(n_vars), (ub_row[var_links], np.arange(n_vars))),
+                         shape=(len(used_links), n_vars))
+    A_eq = sp.csr_matrix((eq_data, (eq_rows, eq_cols)), shape=(len(eq_keys), n_vars))
+    var_keys = [(link_list[l], demand_list[k]) for l, k in zip(var_links, var_coms)]
+    return SparseLP(weights[var_links], A_ub, caps[used_links], A_eq, b_eq,
+                    var_keys=var_keys,
+                    ub_keys=[link_list[l] for l in used_links],
+                    eq_keys=eq_keys,
+                    var_name=lambda k: "D{}_{}_xL{}_{}".format(k[1][0], k[1][1], k[0][0], k[0][1]),
+                    ub_name=lambda l: "LinkCap|L{}_{}".format(l[0], l[1]),
+                    eq_name=lambda k: "NodeCons|{}D{}_{}".format(k[0], k[1][0], k[1][1]),
+                    name="Basic Node Link Formulation")
+
+
+def _reachable(g, source, node_index, n_nodes):
+    """ Boolean array, indexed like `node_index`, of the nodes reachable from `source`. """
+    reached = np.zeros(n_nodes, dtype=bool)
+    reached[node_index[source]] = True
+    stack = [source]
+    while stack:
+        u = stack.pop()
+        for v in g.successors(u):
+            if not reached[node_index[v]]:
+                reached[node_index[v]] = True
+                stack.append(v)
+    return reached
+
+
+def expand_values(lp, g, demands):
+    """ Maps the solution of a presolved node-link problem back to all the (link, demand)
+        keys of the full problem, with zero flow for the variables presolve dropped.
+
+        Returns
+        -------
+        flows : dictionary
+            link flow values indexed by (link, demand) for every link of `g` and every
+            demand pair in `demands`, or None if the problem has no solution, e.g., it
+            is infeasible.
+    """
+    if lp.x is None:
+        return None
+    flows = {}
+    for link in sorted(g.edges()):
+        for d in sorted(demands.keys()):
+            flows[link, d] = 0.0
+    flows.update(lp.values())
+    return flows
+
+
+def link_path_lp(g, demands, paths, wt=None, cap="capacity"):
+    """ Builds the link-path formulation of the capacitated network design problem, the
+        same problem as BasicLinkPathFormulation.py, as a :class:`SparseLP`. The capacity
+        rows are the path-link incidence matrix, see
+        :func:`Utilities.utilities.path_link_incidence`.
+
+        Parameters
+        ----------
+        g : networkx.Graph
+            the network graph.
+        demands : dictionary
+            a dictionary of demands indexed by node pairs.
+        paths : dictionary
+            the candidate paths, indexed by demand pair, with each path a node list.
+        wt : string
+            (optional) the link attribute used as the path cost. By default the cost of a
+            path is its number of hops, as in BasicLinkPathFormulation.py.
+        cap : string
+            (optional) the link capacity attribute.
+
+        Returns
+        -------
+        lp : SparseLP
+            the problem, with variables keyed by (demand, path number), capacity rows
+            keyed by link and demand rows keyed by demand. Names follow
+            BasicLinkPathFormulation.py.
+    """
+    demand_list = sorted(demands.keys())
+    link_list = sorted(g.edges())
+    A_ub, path_keys = path_link_incidence(link_list, paths, demand_list)
+    caps = np.array([g[l[0]][l[1]][cap] for l in link_list], dtype=float)
+    c = np.zeros(len(path_keys))
+    demand_index = {}
+    for i, d in enumerate(demand_list):
+        demand_index[d] = i
+    rows = np.zeros(len(path_keys), dtype=np.int64)
+    for j, (d, p) in enumerate(path_keys):
+        node_list = paths[d][p]
+        if wt is None:
+            c[j] = len(node_list) - 1
+        else:
+            c[j] = sum(g[node_list[i]][node_list[i + 1]][wt] for i in range(len(node_list) - 1))
+        rows[j] = demand_index[d]
+    A_eq = sp.csr_matrix((np.ones(len(path_keys)), (rows, np.arange(len(path_keys)))),
+                         shape=(len(demand_list), len(path_keys)))
+    b_eq = np.array([demands[d] for d in demand_list], dtype=float)
+    return SparseLP(c, A_ub, caps, A_eq, b_eq,
+                    var_keys=path_keys,
+                    ub_keys=link_list,
+                    eq_keys=demand_list,
+                    var_name=lambda k: "xD{}_{}P_{}".format(k[0][0], k[0][1], k[1]),
+                    ub_name=lambda l: "LinkCap|L{}_{}".format(l[0], l[1]),
+                    eq_name=lambda d: "DemandSat_{}_{}".format(d[0], d[1]),
+                    name="Basic Link Path Formulation")
+
+
+if __name__ == "__main__":
+    import time
+    from BasicNodeLinkFormulationNSFtopology import create_nsf_topology, basic_capacitated_node_link
+    from pulp import LpStatus, value
+
+    g = create_nsf_topology()
+    nodes = sorted(g.nodes())
+    demands = {}
+    for a in nodes:
+        for z in nodes:
+            if a != z:
+                demands[a, z] = 0.01
+    tic = time.time()
+    prob, link_flows = basic_capacitated_node_link(g, demands)
+    t_build = time.time() - tic
+    prob.solve()
+    print("PuLP: build {:.3f} seconds, total {:.3f} seconds, {}, objective {}".format(
+        t_build, time.time() - tic, LpStatus[prob.status], value(prob.objective)))
+    for aggregate in [False, True]:
+        tic = time.time()
+        lp = node_link_lp(g, demands, aggregate=aggregate)
+        t_build = time.time() - tic
+        lp.solve()
+        print("Sparse{}: {} variables, build {:.3f} seconds, total {:.3f} seconds, {}, "
+              "objective {}".format(" aggregated" if aggregate else "", lp.num_vars(), t_build,
+                                    time.time() - tic, lp.status, lp.objective))
+    tic = time.time()
+    lp = node_link_lp(g, demands)
+    lp.solve_lazy()
+    print("Sparse, lazy capacity rows: {} of {} rows added, total {:.3f} seconds, {}, "
+          "objective {}".format(len(lp.active_ub), lp.A_ub.shape[0], time.time() - tic,
+                                lp.status, lp.objective))
+    # Most entries of the NSF script's demand vectors are zero
+    for i, d in enumerate(sorted(demands.keys())):
+        demands[d] = 0.05 if i % 10 == 0 else 0.0
+    for build in [node_link_lp, presolve_node_link_lp]:
+        tic = time.time()
+        lp = build(g, demands)
+        lp.solve()
+        print("{}: {} variables, {} rows, total {:.3f} seconds, {}, objective {}".format(
+            build.__name__, lp.num_vars(), lp.A_ub.shape[0] + lp.A_eq.shape[0],
+            time.time() - tic, lp.status, lp.objective))
+    flows = expand_values(lp, g, demands)
+    print("Mapped back to {} (link, demand) flows".format(len(flows)))
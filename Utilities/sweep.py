@@ -0,0 +1,366 @@
+""" Demand sweeps over the node-link formulation.
+    A sweep solves the capacitated network design problem for many demand volume vectors
+    on the same network and demand pairs. Rather than building and solving a new problem
+    at every point, the problem is built once and only the right-hand sides of the flow
+    conservation rows are patched before each re-solve, which with highspy installed
+    starts from the basis of the previous point.
+
+    Large sweeps can be run with :func:`run_sweep`, which splits the points into shards
+    solved by a pool of worker processes, writes the results through a single buffered
+    writer and keeps a checkpoint so that an interrupted sweep picks up where it stopped.
+"""
+import itertools
+import json
+import os
+from multiprocessing import Pool, cpu_count
+import numpy as np
+from Utilities.sparse_lp import node_link_lp, demand_rhs
+
+
+class DemandSweep(object):
+    """ Solves the node-link problem for a sequence of demand volumes.
+
+        Parameters
+        ----------
+        g : networkx.DiGraph
+            a directed network graph.
+        demand_pairs : list
+            the demand (node) pairs, in the order of the volumes given to :meth:`solve`.
+        wt : string
+            (optional) the link weight attribute.
+        cap : string
+            (optional) the link capacity attribute.
+        aggregate : boolean
+            (optional) aggregate the demands by source, see
+            :func:`Utilities.sparse_lp.node_link_lp`.
+
+        The problem is available as the :class:`Utilities.sparse_lp.SparseLP` member `lp`,
+        which holds the solution of the last point solved.
+    """
+    def __init__(self, g, demand_pairs, wt="weight", cap="capacity", aggregate=False):
+        self.demand_pairs = list(demand_pairs)
+        self.lp = node_link_lp(g, dict.fromkeys(self.demand_pairs, 0.0), wt, cap, aggregate)
+        node_list = self.lp.eq_keys.first
+        com_list = self.lp.eq_keys.second
+        self.B = demand_rhs(node_list, com_list, self.demand_pairs, aggregate)
+        self.solved = 0
+
+    def solve(self, volumes):
+        """ Solves the problem for the given demand volumes, patching only the
+            right-hand sides that differ from the previous point.
+
+            Parameters
+            ----------
+            volumes : sequence
+                the demand volumes, in the order of `demand_pairs`.
+
+            Returns
+            -------
+            status : string
+                the PuLP status string, e.g., "Optimal" or "Infeasible".
+        """
+        b_eq = self.B.dot(np.asarray(volumes, dtype=float))
+        rows = np.flatnonzero(b_eq != self.lp.b_eq)
+        self.lp.update_b_eq(rows, b_eq[rows])
+        self.solved += 1
+        return self.lp.solve()
+
+    def run(self, points):
+        """ Solves the problem at each point in turn.
+
+            Parameters
+            ----------
+            points : iterable
+                demand volume vectors, e.g., from :func:`grid_points`.
+
+            Yields
+            ------
+            volumes, status : tuple, string
+                the point and its PuLP status string. The solution is in `lp` until the
+                next point is solved.
+        """
+        for volumes in points:
+            yield volumes, self.solve(volumes)
+
+
+def grid_points(values, n_demands):
+    """ The points of a full grid sweep in the order of nested loops over the demands,
+        the last demand varying fastest.
+
+        Parameters
+        ----------
+        values : sequence
+            the volumes to try for each demand, e.g., numpy.arange(0.0, 2.2, 0.2).
+        n_demands : integer
+            the number of demands.
+    """
+    return itertools.product(values, repeat=n_demands)
+
+
+class GridSpec(object):
+    """ The points of a full grid over the demands, in the order of :func:`grid_points`,
+        addressable by position so that a shard can be produced without the points before it.
+
+        Parameters
+        ----------
+        values : sequence
+            the volumes to try for each demand, e.g., numpy.arange(0.0, 2.2, 0.2).
+        n_demands : integer
+            the number of demands.
+    """
+    def __init__(self, values, n_demands):
+        self.values = list(values)
+        self.n_demands = n_demands
+
+    def __len__(self):
+        return len(self.values) ** self.n_demands
+
+    def points(self, start, stop):
+        """ Returns the points with positions in [start, stop). """
+        base = len(self.values)
+        digits = []
+        i = start
+        for j in range(self.n_demands):
+            digits.append(i % base)
+            i //= base
+        digits.reverse()
+        return list(itertools.islice(self._iterFrom(digits), stop - start))
+
+    def _iterFrom(self, digits):
+        """ Continues the nested loops from the point with the given value indices. """
+        values = self.values
+        base = len(values)
+        digits = list(digits)
+        while True:
+            yield tuple(values[k] for k in digits)
+            j = len(digits) - 1
+            while j >= 0 and digits[j] == base - 1:
+                digits[j] = 0
+                j -= 1
+            if j < 0:
+                return
+            digits[j] += 1
+
+    def describe(self):
+        return {"grid": [float(v) for v in self.values], "n_demands": self.n_demands}
+
+
+class SampleSpec(object):
+    """ Random demand volume vectors, uniform in [low, high). The points of each shard come
+        from a generator seeded with (seed, position of the shard's first point), so they
+        don't depend on the number of workers or on restarts.
+
+        Parameters
+        ----------
+        n_points : integer
+            the number of points.
+        n_demands : integer
+            the number of demands.
+        low, high : float
+            the volume range.
+        seed : integer
+            (optional) the random seed.
+    """
+    def __init__(self, n_points, n_demands, low, high, seed=0):
+        self.n_points = n_points
+        self.n_demands = n_demands
+        self.low = low
+        self.high = high
+        self.seed = seed
+
+    def __len__(self):
+        return self.n_points
+
+    def points(self, start, stop):
+        """ Returns the points with positions in [start, stop), which must be a shard. """
+        rng = np.random.default_rng((self.seed, start))
+        return [tuple(row) for row in rng.uniform(self.low, self.high, (stop - start, self.n_demands))]
+
+    def describe(self):
+        return {"sample": self.n_points, "n_demands": self.n_demands, "low": self.low,
+                "high": self.high, "seed": self.seed}
+
+
+# Per worker state, set up once by _init_sweep_worker
+_worker = {}
+
+
+def _init_sweep_worker(g, demand_pairs, spec, shard_size, wt, cap, aggregate, exact,
+                       prune=False):
+    """ Pool initializer, builds the worker's sweep problem. """
+    _worker["prune"] = prune
+    _worker["sweep"] = DemandSweep(g, demand_pairs, wt, cap, aggregate)
+    _worker["order"] = np.array(_worker["sweep"].lp.pulp_order(), dtype=np.int64)
+    _worker["spec"] = spec
+    _worker["shard_size"] = shard_size
+    _worker["exact"] = exact
+
+
+def _sweep_shard(shard_id):
+    """ Solves the points of a shard and formats the feasible ones as CSV lines. """
+    sweep = _worker["sweep"]
+    order = _worker["order"]
+    spec = _worker["spec"]
+    start = shard_id * _worker["shard_size"]
+    stop = min(start + _worker["shard_size"], len(spec))
+    if _worker["exact"]:
+        from pulp import LpStatus
+    # Start every shard cold so that its results don't depend on which shards the
+    # worker happened to solve before
+    sweep.lp.reset_solver()
+    index = None
+    if _worker["prune"]:
+        from Utilities.feasibility import DominanceIndex
+        index = DominanceIndex(len(sweep.demand_pairs))
+    lines = []
+    for volumes in spec.points(start, stop):
+        if index is not None and index.lookup(volumes) is False:
+            continue  # Dominates a known infeasible point
+        if _worker["exact"]:
+            # Solve the PuLP view with PuLP's default solver, like the original script
+            b_eq = sweep.B.dot(np.asarray(volumes, dtype=float))
+            sweep.lp.update_b_eq(np.arange(len(b_eq)), b_eq)
+            prob, lp_vars = sweep.lp.to_pulp()
+            prob.solve()
+            status = LpStatus[prob.status]
+            values = [v.varValue for v in prob.variables()]
+        else:
+            status = sweep.solve(volumes)
+            if sweep.lp.x is None:
+                values = [None] * len(order)
+            else:
+                values = (sweep.lp.x[order] + 0.0).tolist()  # No negative zeros
+        if index is not None and status in ("Optimal", "Infeasible"):
+            index.add(volumes, status == "Optimal")
+        if status == "Infeasible":
+            continue
+        lines.append("".join(str(x) + ", " for x in itertools.chain(volumes, values)) + "\n")
+    return shard_id, "".join(lines), stop - start
+
+
+def run_sweep(g, demand_pairs, spec, filename, checkpoint=None, processes=None, shard_size=1000,
+              wt="weight", cap="capacity", aggregate=False, exact=False, prune=False):
+    """ Runs a demand sweep in parallel and writes the feasible points to a CSV file.
+
+        Each line holds the demand volumes followed by the values of the variables in the
+        order of PuLP's `prob.variables()`, each followed by ", ", which is the format of the
+        sweep in BasicNodeLinkFormulation.py. Infeasible points are left out.
+
+        The points are split into shards of `shard_size` points, solved by a pool of worker
+        processes. Results are written in shard order and after each shard its id and the
+        file size are recorded in the checkpoint file. If the sweep is interrupted, calling
+        run_sweep again with the same arguments truncates the output to the last checkpoint
+        and solves only the remaining shards.
+
+        Parameters
+        ----------
+        g : networkx.DiGraph
+            a directed network graph.
+        demand_pairs : list
+            the demand (node) pairs, in the order of the point coordinates.
+        spec : GridSpec or SampleSpec
+            the points to solve.
+        filename : string
+            the output CSV file.
+        checkpoint : string
+            (optional) the checkpoint file, by default `filename` + ".ckpt".
+        processes : integer
+            (optional) the number of worker processes, defaults to the number of CPUs.
+            With one process the shards are solved in this process.
+        shard_size : integer
+            (optional) the number of points per shard.
+        wt, cap : string
+            (optional) the link weight and capacity attributes.
+        aggregate : boolean
+            (optional) aggregate the demands by source, see
+            :func:`Utilities.sparse_lp.node_link_lp`. The variables are then per source.
+        exact : boolean
+            (optional) solve each point with PuLP's default solver as the script does,
+            instead of warm started re-solves. Slower, but gives the very same solution
+            where the problem has several optimal ones.
+        prune : boolean
+            (optional) skip the solver for points that dominate an infeasible point of
+            the same shard (see :mod:`Utilities.feasibility`). These points would be left
+            out anyway, but the warm starts of the remaining points change, so where the
+            problem has several optimal solutions a different one may be written.
+
+        Returns
+        -------
+        solved : integer
+            the number of points solved by this call.
+    """
+    if checkpoint is None:
+        checkpoint = filename + ".ckpt"
+    if processes is None:
+        processes = cpu_count()
+    n_shards = (len(spec) + shard_size - 1) // shard_size
+    describe = {"spec": spec.describe(), "pairs": [list(d) for d in demand_pairs],
+                "shard_size": shard_size, "aggregate": aggregate, "exact": exact, "prune": prune}
+    done = []
+    offset = 0
+    if os.path.exists(checkpoint) and os.path.exists(filename):
+        with open(checkpoint) as f:
+            state = json.load(f)
+        if state["describe"] == json.loads(json.dumps(describe)):
+            done = state["done"]
+            offset = state["offset"]
+    pending = [i for i in range(len(done), n_shards)]
+    out = open(filename, "r+" if offset > 0 else "w", buffering=1 << 20)
+    try:
+        out.truncate(offset)
+        out.seek(offset)
+        initargs = (g, demand_pairs, spec, shard_size, wt, cap, aggregate, exact, prune)
+        pool = None
+        if processes > 1 and len(pending) > 1:
+            pool = Pool(processes, initializer=_init_sweep_worker, initargs=initargs)
+            results = pool.imap(_sweep_shard, pending)
+        else:
+            _init_sweep_worker(*initargs)
+            results = (_sweep_shard(i) for i in pending)
+        solved = 0
+        try:
+            for shard_id, text, n_points in results:
+                out.write(text)
+                out.flush()
+                done.append(shard_id)
+                solved += n_points
+                _save_checkpoint(checkpoint, describe, done, out.tell())
+        finally:
+            if pool is not None:
+                pool.terminate()
+                pool.join()
+    finally:
+        out.close()
+    return solved
+
+
+def _save_checkpoint(checkpoint, describe, done, offset):
+    """ Atomically records the completed shards and the matching output size. """
+    tmp_name = checkpoint + ".tmp"
+    with open(tmp_name, "w") as f:
+        json.dump({"describe": describe, "done": done, "offset": offset}, f)
+    os.replace(tmp_name, checkpoint)
+
+
+if __name__ == "__main__":
+    import time
+    import networkx as nx
+
+    # The network and demand pairs of BasicNodeLinkFormulation.py
+    g_temp = nx.Graph()
+    g_temp.add_edge(1, 2, capacity=1, weight=1)
+    g_temp.add_edge(1, 3, capacity=1, weight=1)
+    g_temp.add_edge(2, 3, capacity=1, weight=1)
+    g = g_temp.to_directed()
+    pairs = [(1, 2), (1, 3), (2, 1), (2, 3), (3, 1), (3, 2)]
+    spec = GridSpec(np.arange(0.0, 2.0 + 0.4, 0.4), len(pairs))
+    for processes in [1, cpu_count()]:
+        for name in ["sweep-demo.csv", "sweep-demo.csv.ckpt"]:
+            if os.path.exists(name):
+                os.remove(name)
+        tic = time.time()
+        solved = run_sweep(g, pairs, spec, "sweep-demo.csv", processes=processes)
+        print("{} processes: {} points, {:.3f} ms per point".format(
+            processes, solved, 1000.0 * (time.time() - tic) / solved))
+    print("Re-run after completion solves {} points".format(
+        run_sweep(g, pairs, spec, "sweep-demo.csv")))
@@ -4,9 +4,11 @@
     to aid in the analysis of raw solutions to design problems.
 """
 from math import sqrt
-from Utilities import YenKShortestPaths
+from Utilities.YenKShortestPaths import YenKShortestPaths
 import random
 import networkx as nx
+import numpy as np
+import scipy.sparse as sp
 
 
 def link_in_path(link, node_list):
@@ -35,6 +37,56 @@ def link_in_path(link, node_list):
     return False
 
 
+def path_link_incidence(link_list, paths, demand_list=None):
+    """ Builds the path-link incidence matrix of a set of candidate paths, so that the
+        links of all paths are looked up once instead of calling :func:`link_in_path` for
+        every link and path. Like :func:`link_in_path` a path is incident to a link if it
+        uses the link in either orientation, and at most once.
+
+        Parameters
+        ----------
+        link_list : list
+            the links, as node pairs, giving the rows of the matrix.
+        paths : dictionary
+            the candidate paths, indexed by demand pair, with each path a node list.
+        demand_list : list
+            (optional) the order of the demands, sorted by default.
+
+        Returns
+        -------
+        incidence : scipy.sparse.csr_matrix
+            a len(link_list) by number of paths 0/1 matrix. Multiplying it with a vector
+            of path flows gives the link loads.
+        path_keys : list
+            the (demand, path number) pair of each column, demands in `demand_list`
+            order.
+    """
+    if demand_list is None:
+        demand_list = sorted(paths.keys())
+    index = {}
+    for i, link in enumerate(link_list):
+        index[link] = i
+    rows = []
+    cols = []
+    path_keys = []
+    for d in demand_list:
+        for p, node_list in enumerate(paths[d]):
+            j = len(path_keys)
+            path_keys.append((d, p))
+            path_rows = set()
+            for k in range(len(node_list) - 1):
+                for hop in [(node_list[k], node_list[k + 1]), (node_list[k + 1], node_list[k])]:
+                    i = index.get(hop)
+                    if i is not None:
+                        path_rows.add(i)
+            rows.extend(path_rows)
+            cols.extend([j] * len(path_rows))
+    incidence = sp.csr_matrix((np.ones(len(rows)), (rows, cols)),
+                              shape=(len(link_list), len(path_keys)))
+    incidence.sort_indices()  # Columns in path order within each row
+    return incidence, path_keys
+
+
 def path_valid(g, p):
     """ Checks whether the list nodes p is a valid path in g.
 
@@ -135,7 +187,7 @@ def randomize_cap(graph, cap_min, cap_max, cap="capacity"):
         graph.edge[link[0]][link[1]][cap] = random.randrange(cap_min, cap_max)
 
 
-def gen_cand_paths(g, demands, num):
+def gen_cand_paths(g, demands, num, max_stretch=None, max_cost=None):
     """ Generates demand path candidates.
 
         Parameters
@@ -148,6 +200,11 @@ def gen_cand_paths(g, demands, num):
             The number of paths to be generated via a k-shortest path algorithm. Note that
             `num` simple paths may not exist and that the algorithm will return the maximum
             number of simple paths available.
+        max_stretch : float
+            (optional) only generate paths costing at most this multiple of the demand
+            pair's shortest path cost, e.g., 1.5.
+        max_cost : float
+            (optional) only generate paths costing at most this much.
 
         Returns
         -------
@@ -157,18 +214,10 @@ def gen_cand_paths(g, demands, num):
     """
     paths = {}
     k = num
+    # A single instance shares its shortest path trees among demands with the same source
+    alg = YenKShortestPaths(g)
     for d in demands.keys():
-        paths[d] = []  # Start with an empty list of paths
-        alg = YenKShortestPaths(g)
-        p = alg.findFirstShortestPath(d[0], d[1])
-        if p == None:
-            break
-        paths[d].append(p.nodeList)
-        for i in range(k-1):
-            p = alg.getNextShortestPath()
-            if p == None:
-                break
-            paths[d].append(p.nodeList)
+        paths[d] = [p.nodeList for p in alg.iter_k_shortest(d[0], d[1], k, max_cost, max_stretch)]
     return paths
 
 
@@ -362,11 +411,10 @@ def link_util(g, d_paths, can_paths):
         link_loads : dictionary
             a dictionary index by links with the load or utilization on each link.
     """
+    link_list = list(g.edges())
+    incidence, path_keys = path_link_incidence(link_list, can_paths)
+    loads = incidence.dot(np.array([d_paths[key].varValue for key in path_keys], dtype=float))
     util = {}
-    for e in g.edges():
-        util[e] = 0.0
-        for d in can_paths.keys():
-            for p in range(len(can_paths[d])):
-                if link_in_path(e, can_paths[d][p]):
-                    util[e] += d_paths[d, p].varValue
+    for i, e in enumerate(link_list):
+        util[e] = loads[i]
     return util